@@ -7,23 +7,254 @@
 import os
 import re
 import json
+import time
+import functools
+import importlib.util
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, Any
 
 # AI интеграция
-try:
-    from dotenv import load_dotenv
-    from google import genai
-    AI_AVAILABLE = True
-except ImportError:
-    AI_AVAILABLE = False
+# google-genai тянет gRPC/protobuf, поэтому сами библиотеки импортируются
+# лениво в _init_ai, а здесь только проверяется, что они установлены
+def _ai_libraries_installed() -> bool:
+    """Проверка наличия python-dotenv и google-genai без их импорта"""
+    try:
+        return (importlib.util.find_spec('dotenv') is not None
+                and importlib.util.find_spec('google.genai') is not None)
+    except (ImportError, ValueError):
+        return False
+
+AI_AVAILABLE = _ai_libraries_installed()
+
+# .env уже загружен в этом процессе
+_ENV_LOADED = False
+
+# Категории ключевых слов для keyword-генерации
+# (ключевые слова, являющиеся подстрокой другого ключевого слова той же
+# категории, опущены: "поставь лайк" покрывается "лайк" и т.п.)
+_KEYWORD_CATEGORIES = {
+    'chrome': ('chrome', 'хром', 'браузер'),
+    'new_tab': ('вкладка', 'new tab'),
+    'site': ('.com', '.ru'),
+    'search': ('поиск', 'search', 'найди', 'find'),
+    'youtube': ('youtube', 'ютуб', 'видео'),
+    'tiktok': ('tiktok', 'тикток'),
+    'like': ('лайк', 'like'),
+    'calculator': ('калькулятор', 'calculator', 'посчитай'),
+}
+_KEYWORD_TO_CATEGORY = {
+    keyword: category
+    for category, keywords in _KEYWORD_CATEGORIES.items()
+    for keyword in keywords
+}
+
+def _trie_pattern(words) -> str:
+    """Регулярное выражение из префиксного дерева слов (общие префиксы проверяются один раз)"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}  # Конец слова
+    
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        pattern = '(?:' + '|'.join(branches) + ')'
+        return pattern + '?' if '' in node else pattern
+    
+    return build(trie)
+
+# Lookahead позволяет находить пересекающиеся ключевые слова за один проход
+_KEYWORD_RE = re.compile('(?=(' + _trie_pattern(_KEYWORD_TO_CATEGORY) + '))')
+
+# Числа в тексте
+_NUMBER_RE = re.compile(r'\d+')
+
+# Формат длительности команды wait (3s, 1.5s, 500ms)
+_WAIT_DURATION_RE = re.compile(r'^\d+(\.\d+)?(s|ms)$')
+
+
+def _check_template_line(argument: str, line_number: int, errors: list,
+                         warnings: list, available_templates: frozenset) -> None:
+    """Проверка шаблона в командах click/open"""
+    if argument not in available_templates and not argument.startswith('('):
+        warnings.append(f"Строка {line_number}: Шаблон '{argument}' не найден в справочнике")
+
+
+def _check_wait_line(argument: str, line_number: int, errors: list,
+                     warnings: list, available_templates: frozenset) -> None:
+    """Проверка синтаксиса wait"""
+    if not _WAIT_DURATION_RE.match(argument):
+        errors.append(f"Строка {line_number}: Неверный формат времени '{argument}'. Используйте: 3s, 1.5s, 500ms")
+
+
+# Проверки строк .atlas кода по первому слову команды
+_LINE_VALIDATORS = {
+    'click': _check_template_line,
+    'open': _check_template_line,
+    'wait': _check_wait_line,
+}
+
+# Словесные числа (ищутся как подстроки, чтобы ловить словоформы)
+_WORD_NUMBERS = {
+    'один': 1, 'одну': 1, 'one': 1,
+    'два': 2, 'две': 2, 'two': 2,
+    'три': 3, 'three': 3,
+    'четыре': 4, 'four': 4,
+    'пять': 5, 'five': 5,
+    'десять': 10, 'ten': 10
+}
+_WORD_NUMBER_RE = re.compile('|'.join(_WORD_NUMBERS))
+
+# Операторы калькулятора в порядке приоритета: (символ, слово)
+_CALC_OPERATORS = (('+', 'плюс'), ('-', 'минус'), ('*', 'умножить'), ('/', 'разделить'))
+_CALC_OPERATOR_TOKENS = {
+    token: symbol
+    for symbol, word in _CALC_OPERATORS
+    for token in (symbol, word)
+}
+# Число или оператор в запросе
+_CALC_TOKEN_RE = re.compile(r'(\d+)|(' + '|'.join(map(re.escape, _CALC_OPERATOR_TOKENS)) + ')')
+
+# Пункт списка шаблонов в справочнике: "   • ChromeApp copy" (имя - вся строка)
+# или "- ChromeApp - описание" во встроенном справочнике (имя - первое слово)
+_TEMPLATE_BULLET_RE = re.compile(
+    r'^\s*(?:•[^\S\n]*(\S(?:.*\S)?)|[-*][^\S\n]+(\S+))',
+    re.MULTILINE
+)
+
+# Поисковый запрос в кавычках: после ключевого слова или любой текст в кавычках
+_QUOTED_QUERY_RE = re.compile(r'(?:найди|search|поищи)\s+"([^"]+)"|"([^"]+)"', re.IGNORECASE)
+# Предлог в начале запроса после ключевого слова ("про на ..." -> "...")
+_QUERY_PREPOSITION_RE = re.compile(r'^(на|в|по|для|about|on|in|for)\s+')
+
+# Паттерны явных URL
+_URL_PATTERNS = (
+    re.compile(r'(tiktok\.com)'),
+    re.compile(r'(youtube\.com)'),
+    re.compile(r'(google\.com)'),
+    re.compile(r'(github\.com)'),
+    re.compile(r'(\w+\.com)'),
+    re.compile(r'(\w+\.ru)'),
+)
+
+def _newest_mtime(root: Path) -> float:
+    """Время изменения самого нового файла в дереве (os.scandir без лишних stat)"""
+    newest = 0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    file_time = entry.stat().st_mtime
+                    if file_time > newest:
+                        newest = file_time
+    return newest
+
+# Базовый DSL справочник (если файл справочника не найден)
+_FALLBACK_REFERENCE = """
+DSL КОМАНДЫ:
+- open <template> - открыть приложение
+- click <template> - кликнуть по элементу  
+- type "text" - ввести текст
+- wait 3s - ждать 3 секунды
+- press enter - нажать клавишу
+- hotkey cmd+c - комбинация клавиш
+
+ДОСТУПНЫЕ ШАБЛОНЫ:
+- ChromeApp - иконка Chrome
+- ChromeNewTab - кнопка новой вкладки
+- ChromeSearchField - поле поиска
+- Chrome-YouTube-SearchField - поле поиска YouTube
+- Chrome-TikTok-Like - кнопка лайка TikTok
+"""
+
+# Промпт AI-генерации: {reference} - DSL справочник, {request} - запрос пользователя
+_AI_PROMPT_TEMPLATE = """Ты - эксперт по созданию .atlas макросов для автоматизации macOS.
+
+DSL СПРАВОЧНИК:
+{reference}
+
+ЗАДАЧА: Создай .atlas макрос для запроса: "{request}"
+
+ТРЕБОВАНИЯ:
+1. Используй ТОЛЬКО команды из DSL справочника выше
+2. Используй ТОЛЬКО существующие шаблоны из справочника
+3. Добавь комментарии для понимания
+4. Макрос должен быть логичным и выполнимым
+5. НЕ используй несуществующие команды или шаблоны
+
+ВАЖНО: Отвечай ТОЛЬКО кодом .atlas без дополнительных объяснений!
+
+ФОРМАТ ОТВЕТА:
+# Generated Macro
+# Description: {request}
+
+[твой .atlas код здесь]"""
+
+# Строки метаданных, которые не сохраняются в переменную
+_METADATA_PREFIXES = ("# Generated", "# Created", "# Description:")
+
+# Очистка имени файла макроса
+_UNSAFE_NAME_CHARS_RE = re.compile(r'[^\w\s-]')
+_NAME_SEPARATORS_RE = re.compile(r'[-\s]+')
+# То же удаление для ASCII-текста через str.translate
+_SAFE_NAME_TABLE = {
+    code: None for code in range(128)
+    if _UNSAFE_NAME_CHARS_RE.match(chr(code))
+}
+
+# Слова для имени переменной и служебные слова, которые пропускаются
+_NAME_WORD_RE = re.compile(r'\b[а-яё]+\b|\b[a-z]+\b')
+_STOP_WORDS = frozenset({
+    'и', 'в', 'на', 'с', 'по', 'для', 'от', 'до', 'из', 'к', 'о', 'у', 'за',
+    'под', 'над', 'при', 'через', 'между',
+})
+
+# Постоянные блоки команд keyword-генерации (готовые многострочные фрагменты)
+_OPEN_CHROME_BLOCK = "open ChromeApp\nwait 2s"
+_NEW_TAB_BLOCK = "click ChromeNewTab\nwait 1s"
+_SEARCH_FIELD_BLOCK = "click ChromeSearchField\nwait 1s"
+_YOUTUBE_SEARCH_FIELD_BLOCK = "click Chrome-YouTube-SearchField\nwait 1s"
+_SUBMIT_PAGE_BLOCK = "press enter\nwait 5s"
+_SUBMIT_SEARCH_BLOCK = "press enter\nwait 3s"
+_OPEN_YOUTUBE_BLOCK = f'{_SEARCH_FIELD_BLOCK}\ntype "youtube.com"\n{_SUBMIT_PAGE_BLOCK}'
+_OPEN_TIKTOK_BLOCK = f'{_SEARCH_FIELD_BLOCK}\ntype "tiktok.com"\n{_SUBMIT_PAGE_BLOCK}'
+_OPEN_CALCULATOR_BLOCK = "open Calculator\nwait 2s"
+_EMPTY_MACRO_BLOCK = "# Базовый макрос\nwait 1s\n# Добавьте нужные команды"
+# Блоки с параметрами запроса: один str.format на блок
+_OPEN_URL_TEMPLATE = f'{_SEARCH_FIELD_BLOCK}\ntype "{{url}}"\n{_SUBMIT_PAGE_BLOCK}'
+_SEARCH_TEMPLATE = f'{_SEARCH_FIELD_BLOCK}\ntype "{{query}}"\n{_SUBMIT_SEARCH_BLOCK}'
+_YOUTUBE_SEARCH_TEMPLATE = f'{_YOUTUBE_SEARCH_FIELD_BLOCK}\ntype "{{query}}"\n{_SUBMIT_SEARCH_BLOCK}'
+_TIKTOK_LIKES_TEMPLATE = "repeat {count}:\n  click Chrome-TikTok-Like\n  wait 1.5s\n  scroll down\n  wait 2s\nend"
+_CALCULATION_TEMPLATE = (
+    'type "{first}"\n'
+    "wait 0.5s\n"
+    "press {operator}\n"
+    "wait 0.5s\n"
+    'type "{second}"\n'
+    "wait 0.5s\n"
+    "press enter"
+)
 
 class SimpleAIGenerator:
     """
     Простой AI генератор .atlas макросов
     """
     
+    # Gemini клиенты, общие для всех экземпляров (ключ - API key)
+    _ai_clients: Dict[str, Any] = {}
+    
+    # Каталоги вывода, уже созданные в этом процессе (абсолютные пути)
+    _created_dirs: set = set()
+    
     def __init__(self, dsl_reference_path: str = "data/DSL_REFERENCE.txt"):
         """
         Инициализация генератора
@@ -34,7 +265,13 @@ class SimpleAIGenerator:
         self.dsl_reference_path = Path(dsl_reference_path)
         self.dsl_reference = ""
         self.output_dir = Path("data/generated_macros")
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        output_key = os.path.abspath(self.output_dir)
+        if output_key not in self._created_dirs:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(output_key)
+        
+        # Кэш команд keyword-генерации для повторяющихся запросов
+        self._keyword_commands = functools.lru_cache(maxsize=256)(self._build_keyword_commands)
         
         # Загружаем DSL справочник
         self._load_dsl_reference()
@@ -51,10 +288,14 @@ class SimpleAIGenerator:
     
     def _load_dsl_reference(self):
         """Загрузка DSL справочника"""
+        # Сбрасываем кэш шаблонов: справочник меняется
+        self._available_templates = None
+        self._template_names = None
+        
         if self.dsl_reference_path.exists():
             try:
-                with open(self.dsl_reference_path, 'r', encoding='utf-8') as f:
-                    self.dsl_reference = f.read()
+                # Читаем байты целиком и декодируем один раз (без текстового слоя io)
+                self.dsl_reference = self.dsl_reference_path.read_bytes().decode('utf-8')
                 print(f"📋 DSL справочник загружен: {len(self.dsl_reference)} символов")
             except Exception as e:
                 print(f"❌ Ошибка загрузки DSL справочника: {e}")
@@ -66,10 +307,6 @@ class SimpleAIGenerator:
     def _auto_update_reference(self):
         """Автоматическое обновление DSL справочника из templates"""
         try:
-            from pathlib import Path
-            import subprocess
-            import os
-            
             templates_path = Path("templates")
             if not templates_path.exists():
                 print("⚠️ Папка templates не найдена, пропускаем автообновление")
@@ -81,29 +318,39 @@ class SimpleAIGenerator:
                 reference_time = self.dsl_reference_path.stat().st_mtime
             
             # Находим самый новый файл в templates
-            newest_template_time = 0
-            for template_file in templates_path.rglob("*"):
-                if template_file.is_file():
-                    file_time = template_file.stat().st_mtime
-                    if file_time > newest_template_time:
-                        newest_template_time = file_time
+            newest_template_time = _newest_mtime(templates_path)
             
             # Если templates новее справочника - обновляем
             if newest_template_time > reference_time:
                 print("🔄 Обнаружены новые шаблоны, обновляем DSL справочник...")
                 
-                # Запускаем генератор
-                result = subprocess.run([
-                    "python3", "dsl_reference_generator.py", 
-                    "--output", str(self.dsl_reference_path)
-                ], capture_output=True, text=True, cwd=Path.cwd())
+                try:
+                    from utils.dsl_reference_generator import DSLReferenceGenerator
+                except ImportError:
+                    DSLReferenceGenerator = None
                 
-                if result.returncode == 0:
+                if DSLReferenceGenerator is not None:
+                    # Генерируем справочник в текущем процессе
+                    reference_generator = DSLReferenceGenerator(str(templates_path))
+                    output_path = reference_generator.generate_reference(str(self.dsl_reference_path))
+                    updated = output_path is not None
+                    error = "нет шаблонов для генерации справочника"
+                else:
+                    # Запускаем генератор отдельным процессом
+                    import subprocess
+                    result = subprocess.run([
+                        "python3", "utils/dsl_reference_generator.py",
+                        "--output", str(self.dsl_reference_path)
+                    ], capture_output=True, text=True, cwd=Path.cwd())
+                    updated = result.returncode == 0
+                    error = result.stderr
+                
+                if updated:
                     print("✅ DSL справочник автоматически обновлен")
                     # Перезагружаем справочник
                     self._load_dsl_reference()
                 else:
-                    print(f"❌ Ошибка автообновления: {result.stderr}")
+                    print(f"❌ Ошибка автообновления: {error}")
             else:
                 print("✅ DSL справочник актуален")
                 
@@ -116,17 +363,27 @@ class SimpleAIGenerator:
             print("⚠️ AI библиотеки не установлены. Используется keyword-based генерация")
             return
         
+        global _ENV_LOADED
+        
         try:
-            # Загружаем переменные окружения
-            load_dotenv()
+            # Загружаем переменные окружения (.env читается один раз за процесс)
+            if not _ENV_LOADED:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _ENV_LOADED = True
             
             api_key = os.getenv('GEMINI_API_KEY')
             if not api_key:
                 print("⚠️ GEMINI_API_KEY не найден в .env файле")
                 return
             
-            # Инициализируем клиент
-            self.ai_client = genai.Client(api_key=api_key)
+            # Инициализируем клиент (переиспользуем уже созданный для этого ключа)
+            ai_client = self._ai_clients.get(api_key)
+            if ai_client is None:
+                from google import genai
+                ai_client = genai.Client(api_key=api_key)
+                self._ai_clients[api_key] = ai_client
+            self.ai_client = ai_client
             self.ai_model = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
             
             print(f"✅ Gemini AI инициализирован: {self.ai_model}")
@@ -137,22 +394,7 @@ class SimpleAIGenerator:
     
     def _get_fallback_reference(self) -> str:
         """Базовый DSL справочник если файл не найден"""
-        return """
-DSL КОМАНДЫ:
-- open <template> - открыть приложение
-- click <template> - кликнуть по элементу  
-- type "text" - ввести текст
-- wait 3s - ждать 3 секунды
-- press enter - нажать клавишу
-- hotkey cmd+c - комбинация клавиш
-
-ДОСТУПНЫЕ ШАБЛОНЫ:
-- ChromeApp - иконка Chrome
-- ChromeNewTab - кнопка новой вкладки
-- ChromeSearchField - поле поиска
-- Chrome-YouTube-SearchField - поле поиска YouTube
-- Chrome-TikTok-Like - кнопка лайка TikTok
-"""
+        return _FALLBACK_REFERENCE
     
     def generate_macro(self, user_request: str, use_ai: Optional[bool] = None) -> Dict[str, Any]:
         """
@@ -167,7 +409,9 @@ DSL КОМАНДЫ:
         """
         print(f"🎯 Генерация макроса: {user_request[:50]}...")
         
-        start_time = datetime.now()
+        start_time = time.perf_counter()
+        # Одно время генерации для заголовка макроса и имени файла
+        generated_at = datetime.now()
         
         try:
             # Автоматически определяем использование AI
@@ -179,19 +423,19 @@ DSL КОМАНДЫ:
                 atlas_code = self._generate_with_ai_api(user_request)
             else:
                 # Простая логика на основе ключевых слов
-                atlas_code = self._generate_with_keywords(user_request)
+                atlas_code = self._generate_with_keywords(user_request, generated_at)
             
             if not atlas_code:
                 return {
                     "success": False,
                     "error": "Не удалось сгенерировать макрос",
-                    "execution_time": (datetime.now() - start_time).total_seconds()
+                    "execution_time": time.perf_counter() - start_time
                 }
             
             # Сохраняем макрос
-            file_path = self._save_macro(atlas_code, user_request)
+            file_path = self._save_macro(atlas_code, user_request, generated_at)
             
-            execution_time = (datetime.now() - start_time).total_seconds()
+            execution_time = time.perf_counter() - start_time
             
             result = {
                 "success": True,
@@ -213,160 +457,119 @@ DSL КОМАНДЫ:
             return {
                 "success": False,
                 "error": str(e),
-                "execution_time": (datetime.now() - start_time).total_seconds()
+                "execution_time": time.perf_counter() - start_time
             }
     
-    def _generate_with_keywords(self, user_request: str) -> str:
+    def _generate_with_keywords(self, user_request: str,
+                                generated_at: Optional[datetime] = None) -> str:
         """
         Генерация макроса на основе ключевых слов
         (простая логика без AI API)
         """
+        if generated_at is None:
+            generated_at = datetime.now()
+        
+        # Заголовок (пустая строка отделяет его от команд)
+        header = (
+            "# Generated Macro\n"
+            f"# Description: {user_request}\n"
+            f"# Generated: {generated_at.isoformat()}\n"
+        )
+        
+        # Команды зависят только от текста запроса - повторные запросы берутся из кэша
+        return header + "\n" + self._keyword_commands(user_request)
+    
+    def _build_keyword_commands(self, user_request: str) -> str:
+        """Команды макроса по ключевым словам запроса (без заголовка)"""
         request_lower = user_request.lower()
-        atlas_lines = []
-        
-        # Заголовок
-        atlas_lines.append(f"# Generated Macro")
-        atlas_lines.append(f"# Description: {user_request}")
-        atlas_lines.append(f"# Generated: {datetime.now().isoformat()}")
-        atlas_lines.append("")
+        # Один проход скомпилированного дерева ключевых слов на уровне C
+        keywords = set(_KEYWORD_RE.findall(request_lower))
+        categories = {_KEYWORD_TO_CATEGORY[keyword] for keyword in keywords}
+        parts = []
         
-        # Анализируем запрос и генерируем команды
+        # Анализируем запрос и добавляем блоки команд
         
         # 1. Открытие приложений
-        if any(word in request_lower for word in ['chrome', 'хром', 'браузер']):
-            atlas_lines.append("open ChromeApp")
-            atlas_lines.append("wait 2s")
+        if 'chrome' in categories:
+            parts.append(_OPEN_CHROME_BLOCK)
         
         # 2. Новая вкладка
-        if any(word in request_lower for word in ['новая вкладка', 'new tab', 'вкладка']):
-            atlas_lines.append("click ChromeNewTab")
-            atlas_lines.append("wait 1s")
+        if 'new_tab' in categories:
+            parts.append(_NEW_TAB_BLOCK)
         
         # 3. Прямой переход на сайт (tiktok.com, youtube.com, etc)
-        if any(site in request_lower for site in ['tiktok.com', 'youtube.com', 'google.com', '.com', '.ru']):
-            atlas_lines.append("click ChromeSearchField")
-            atlas_lines.append("wait 1s")
-            
+        if 'site' in categories:
             # Извлекаем URL
-            url = self._extract_url(user_request)
-            if url:
-                atlas_lines.append(f'type "{url}"')
-            else:
-                atlas_lines.append('type "google.com"')
-            
-            atlas_lines.append("press enter")
-            atlas_lines.append("wait 5s")
+            url = self._extract_url(user_request, request_lower) or "google.com"
+            parts.append(_OPEN_URL_TEMPLATE.format(url=url))
         
         # 4. Поиск (только если нет прямого URL)
-        elif any(word in request_lower for word in ['поиск', 'search', 'найди', 'find']):
-            atlas_lines.append("click ChromeSearchField")
-            atlas_lines.append("wait 1s")
-            
+        elif 'search' in categories:
             # Извлекаем поисковый запрос
-            search_query = self._extract_search_query(user_request)
-            if search_query:
-                atlas_lines.append(f'type "{search_query}"')
-            else:
-                atlas_lines.append('type "search query"')
-            
-            atlas_lines.append("press enter")
-            atlas_lines.append("wait 3s")
+            search_query = self._extract_search_query(user_request, request_lower) or "search query"
+            parts.append(_SEARCH_TEMPLATE.format(query=search_query))
         
         # 4. YouTube
-        if any(word in request_lower for word in ['youtube', 'ютуб', 'видео']):
-            if 'поиск' in request_lower or 'search' in request_lower:
-                atlas_lines.append("click Chrome-YouTube-SearchField")
-                atlas_lines.append("wait 1s")
-                
-                search_query = self._extract_search_query(user_request)
-                if search_query:
-                    atlas_lines.append(f'type "{search_query}"')
-                else:
-                    atlas_lines.append('type "video search"')
-                
-                atlas_lines.append("press enter")
-                atlas_lines.append("wait 3s")
+        if 'youtube' in categories:
+            if 'поиск' in keywords or 'search' in keywords:
+                search_query = self._extract_search_query(user_request, request_lower) or "video search"
+                parts.append(_YOUTUBE_SEARCH_TEMPLATE.format(query=search_query))
             else:
                 # Просто открыть YouTube
-                atlas_lines.append("click ChromeSearchField")
-                atlas_lines.append("wait 1s")
-                atlas_lines.append('type "youtube.com"')
-                atlas_lines.append("press enter")
-                atlas_lines.append("wait 5s")
+                parts.append(_OPEN_YOUTUBE_BLOCK)
         
         # 5. TikTok
-        if any(word in request_lower for word in ['tiktok', 'тикток']):
-            atlas_lines.append("click ChromeSearchField")
-            atlas_lines.append("wait 1s")
-            atlas_lines.append('type "tiktok.com"')
-            atlas_lines.append("press enter")
-            atlas_lines.append("wait 5s")
+        if 'tiktok' in categories:
+            parts.append(_OPEN_TIKTOK_BLOCK)
             
             # Лайки
-            if any(word in request_lower for word in ['лайк', 'like', 'поставь лайк']):
+            if 'like' in categories:
                 # Извлекаем количество лайков
-                like_count = self._extract_number(user_request, default=3)
-                atlas_lines.append(f"repeat {like_count}:")
-                atlas_lines.append("  click Chrome-TikTok-Like")
-                atlas_lines.append("  wait 1.5s")
-                atlas_lines.append("  scroll down")
-                atlas_lines.append("  wait 2s")
-                atlas_lines.append("end")
+                like_count = self._extract_number(user_request, default=3, text_lower=request_lower)
+                parts.append(_TIKTOK_LIKES_TEMPLATE.format(count=like_count))
         
         # 6. Калькулятор
-        if any(word in request_lower for word in ['калькулятор', 'calculator', 'посчитай']):
-            atlas_lines.append("open Calculator")
-            atlas_lines.append("wait 2s")
+        if 'calculator' in categories:
+            parts.append(_OPEN_CALCULATOR_BLOCK)
+            
+            # Простые вычисления: числа и операторы за один проход
+            numbers = []
+            operators = set()
+            for number, operator_token in _CALC_TOKEN_RE.findall(request_lower):
+                if number:
+                    numbers.append(number)
+                else:
+                    operators.add(_CALC_OPERATOR_TOKENS[operator_token])
             
-            # Простые вычисления
-            numbers = re.findall(r'\d+', user_request)
             if len(numbers) >= 2:
-                atlas_lines.append(f"type \"{numbers[0]}\"")
-                atlas_lines.append("wait 0.5s")
-                
-                if '+' in user_request or 'плюс' in request_lower:
-                    atlas_lines.append("press +")
-                elif '-' in user_request or 'минус' in request_lower:
-                    atlas_lines.append("press -")
-                elif '*' in user_request or 'умножить' in request_lower:
-                    atlas_lines.append("press *")
-                elif '/' in user_request or 'разделить' in request_lower:
-                    atlas_lines.append("press /")
-                else:
-                    atlas_lines.append("press +")
+                # Первый найденный по приоритету оператор, по умолчанию сложение
+                operator = next(
+                    (symbol for symbol, _ in _CALC_OPERATORS if symbol in operators),
+                    '+'
+                )
                 
-                atlas_lines.append("wait 0.5s")
-                atlas_lines.append(f"type \"{numbers[1]}\"")
-                atlas_lines.append("wait 0.5s")
-                atlas_lines.append("press enter")
+                parts.append(_CALCULATION_TEMPLATE.format(
+                    first=numbers[0], operator=operator, second=numbers[1]
+                ))
         
         # 7. Общие действия
-        if not atlas_lines or len(atlas_lines) <= 4:  # Только заголовок
+        if not parts:
             # Базовый макрос если ничего не распознали
-            atlas_lines.append("# Базовый макрос")
-            atlas_lines.append("wait 1s")
-            atlas_lines.append("# Добавьте нужные команды")
+            parts.append(_EMPTY_MACRO_BLOCK)
         
-        return "\n".join(atlas_lines)
+        return "\n".join(parts)
     
-    def _extract_search_query(self, text: str) -> Optional[str]:
-        """Извлечение поискового запроса из текста"""
-        # Паттерны для поиска
-        patterns = [
-            r'найди\s+"([^"]+)"',
-            r'search\s+"([^"]+)"',
-            r'поищи\s+"([^"]+)"',
-            r'"([^"]+)"',  # Любой текст в кавычках
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                return match.group(1)
+    def _extract_search_query(self, text: str, text_lower: Optional[str] = None) -> Optional[str]:
+        """Извлечение поискового запроса из текста (text_lower - уже приведенный к нижнему регистру text)"""
+        # Один проход по тексту вместо отдельного поиска для каждого паттерна
+        match = _QUOTED_QUERY_RE.search(text)
+        if match:
+            return match.group(1) or match.group(2)
         
         # Попробуем извлечь после ключевых слов
         keywords = ['найди', 'search', 'поищи', 'про', 'about']
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         
         for keyword in keywords:
             if keyword in text_lower:
@@ -375,51 +578,33 @@ DSL КОМАНДЫ:
                 if len(parts) > 1:
                     query = parts[1].strip()
                     # Убираем лишние слова
-                    query = re.sub(r'^(на|в|по|для|about|on|in|for)\s+', '', query)
+                    query = _QUERY_PREPOSITION_RE.sub('', query)
                     if query and len(query) > 2:
                         return query[:50]  # Ограничиваем длину
         
         return None
     
-    def _extract_number(self, text: str, default: int = 1) -> int:
-        """Извлечение числа из текста"""
-        numbers = re.findall(r'\d+', text)
-        if numbers:
-            return int(numbers[0])
+    def _extract_number(self, text: str, default: int = 1, text_lower: Optional[str] = None) -> int:
+        """Извлечение числа из текста (text_lower - уже приведенный к нижнему регистру text)"""
+        number_match = _NUMBER_RE.search(text)
+        if number_match:
+            return int(number_match.group())
         
         # Словесные числа
-        word_numbers = {
-            'один': 1, 'одну': 1, 'one': 1,
-            'два': 2, 'две': 2, 'two': 2,
-            'три': 3, 'three': 3,
-            'четыре': 4, 'four': 4,
-            'пять': 5, 'five': 5,
-            'десять': 10, 'ten': 10
-        }
-        
-        text_lower = text.lower()
-        for word, num in word_numbers.items():
-            if word in text_lower:
-                return num
+        word_match = _WORD_NUMBER_RE.search(text.lower() if text_lower is None else text_lower)
+        if word_match:
+            return _WORD_NUMBERS[word_match.group()]
         
         return default
     
-    def _extract_url(self, text: str) -> str:
-        """Извлекает URL из текста"""
-        import re
+    def _extract_url(self, text: str, text_lower: Optional[str] = None) -> str:
+        """Извлекает URL из текста (text_lower - уже приведенный к нижнему регистру text)"""
+        if text_lower is None:
+            text_lower = text.lower()
         
         # Ищем явные URL
-        url_patterns = [
-            r'(tiktok\.com)',
-            r'(youtube\.com)', 
-            r'(google\.com)',
-            r'(github\.com)',
-            r'(\w+\.com)',
-            r'(\w+\.ru)',
-        ]
-        
-        for pattern in url_patterns:
-            match = re.search(pattern, text.lower())
+        for pattern in _URL_PATTERNS:
+            match = pattern.search(text_lower)
             if match:
                 return match.group(1)
         
@@ -432,15 +617,21 @@ DSL КОМАНДЫ:
         # 2. Есть циклы или сложная логика
         # 3. Запрос содержит ключевые слова для повторного использования
         
-        lines = [line.strip() for line in atlas_code.split('\n') if line.strip() and not line.strip().startswith('#')]
-        
-        # Более 3 команд
-        if len(lines) > 3:
-            return True
-        
-        # Есть циклы
-        if any('repeat' in line for line in lines):
-            return True
+        # Один проход по строкам: считаем команды и ищем циклы
+        command_count = 0
+        for line in atlas_code.split('\n'):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            
+            # Есть циклы
+            if 'repeat' in line:
+                return True
+            
+            # Более 3 команд
+            command_count += 1
+            if command_count > 3:
+                return True
         
         # Ключевые слова для повторного использования
         reuse_keywords = ['часто', 'обычно', 'всегда', 'каждый раз', 'постоянно', 'регулярно']
@@ -451,17 +642,17 @@ DSL КОМАНДЫ:
     
     def _suggest_variable_name(self, user_request: str) -> str:
         """Предлагает имя для переменной на основе запроса"""
-        # Извлекаем ключевые слова
-        words = re.findall(r'\b[а-яё]+\b|\b[a-z]+\b', user_request.lower())
-        
-        # Фильтруем служебные слова
-        stop_words = {'и', 'в', 'на', 'с', 'по', 'для', 'от', 'до', 'из', 'к', 'о', 'у', 'за', 'под', 'над', 'при', 'через', 'между'}
-        meaningful_words = [word for word in words if word not in stop_words and len(word) > 2]
-        
-        # Берем первые 2-3 слова и делаем CamelCase
-        if meaningful_words:
-            selected_words = meaningful_words[:3]
-            return ''.join(word.capitalize() for word in selected_words)
+        # Берем первые 2-3 значимых слова (без служебных) и делаем CamelCase
+        selected_words = []
+        for match in _NAME_WORD_RE.finditer(user_request.lower()):
+            word = match.group()
+            if len(word) > 2 and word not in _STOP_WORDS:
+                selected_words.append(word.capitalize())
+                if len(selected_words) == 3:
+                    break
+        
+        if selected_words:
+            return ''.join(selected_words)
         
         return "CustomMacro"
     
@@ -491,17 +682,11 @@ DSL КОМАНДЫ:
     
     def _clean_atlas_for_variable(self, atlas_code: str) -> str:
         """Очищает .atlas код для сохранения как переменная"""
-        lines = atlas_code.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line_stripped = line.strip()
-            # Пропускаем метаданные
-            if (line_stripped.startswith("# Generated") or 
-                line_stripped.startswith("# Created") or
-                line_stripped.startswith("# Description:")):
-                continue
-            cleaned_lines.append(line)
+        # Пропускаем метаданные
+        cleaned_lines = [
+            line for line in atlas_code.split('\n')
+            if not line.strip().startswith(_METADATA_PREFIXES)
+        ]
         
         return '\n'.join(cleaned_lines).strip()
     
@@ -512,28 +697,8 @@ DSL КОМАНДЫ:
         print("🤖 Gemini AI генерация...")
         
         try:
-            # Формируем промпт
-            prompt = f"""Ты - эксперт по созданию .atlas макросов для автоматизации macOS.
-
-DSL СПРАВОЧНИК:
-{self.dsl_reference}
-
-ЗАДАЧА: Создай .atlas макрос для запроса: "{user_request}"
-
-ТРЕБОВАНИЯ:
-1. Используй ТОЛЬКО команды из DSL справочника выше
-2. Используй ТОЛЬКО существующие шаблоны из справочника
-3. Добавь комментарии для понимания
-4. Макрос должен быть логичным и выполнимым
-5. НЕ используй несуществующие команды или шаблоны
-
-ВАЖНО: Отвечай ТОЛЬКО кодом .atlas без дополнительных объяснений!
-
-ФОРМАТ ОТВЕТА:
-# Generated Macro
-# Description: {user_request}
-
-[твой .atlas код здесь]"""
+            # Формируем промпт (статичный шаблон, подставляются только справочник и запрос)
+            prompt = _AI_PROMPT_TEMPLATE.format(reference=self.dsl_reference, request=user_request)
 
             # Вызов Gemini API
             response = self.ai_client.models.generate_content(
@@ -557,16 +722,18 @@ DSL СПРАВОЧНИК:
     def _extract_atlas_code(self, ai_response: str) -> str:
         """Извлечение .atlas кода из ответа AI"""
         try:
-            # Убираем markdown блоки если есть
-            if '```atlas' in ai_response:
+            # Убираем markdown блоки если есть (find вместо отдельной проверки `in`)
+            start = ai_response.find('```atlas')
+            if start != -1:
                 # Извлекаем код между ```atlas и ```
-                start = ai_response.find('```atlas') + 8
-                end = ai_response.find('```', start)
-                if end != -1:
-                    return ai_response[start:end].strip()
-            elif '```' in ai_response:
+                start += 8
+            else:
                 # Извлекаем код между ``` и ```
-                start = ai_response.find('```') + 3
+                start = ai_response.find('```')
+                if start != -1:
+                    start += 3
+            
+            if start != -1:
                 end = ai_response.find('```', start)
                 if end != -1:
                     return ai_response[start:end].strip()
@@ -578,81 +745,110 @@ DSL СПРАВОЧНИК:
             print(f"⚠️ Ошибка извлечения кода: {e}")
             return ai_response.strip()
     
-    def _save_macro(self, atlas_code: str, user_request: str) -> Path:
+    def _save_macro(self, atlas_code: str, user_request: str,
+                    generated_at: Optional[datetime] = None) -> Path:
         """Сохранение макроса в файл"""
         # Генерируем имя файла
-        safe_name = re.sub(r'[^\w\s-]', '', user_request)
-        safe_name = re.sub(r'[-\s]+', '_', safe_name)
+        if user_request.isascii():
+            # ASCII: удаляем лишние символы одной таблицей str.translate
+            safe_name = user_request.translate(_SAFE_NAME_TABLE)
+        else:
+            safe_name = _UNSAFE_NAME_CHARS_RE.sub('', user_request)
+        safe_name = _NAME_SEPARATORS_RE.sub('_', safe_name)
         safe_name = safe_name[:30].lower().strip('_')
         
         if not safe_name:
             safe_name = "generated_macro"
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = (generated_at or datetime.now()).strftime("%Y%m%d_%H%M%S")
         filename = f"{safe_name}_{timestamp}.atlas"
         
         file_path = self.output_dir / filename
         
-        # Сохраняем
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(atlas_code)
+        # Сохраняем атомарно: пишем во временный файл и переименовываем,
+        # чтобы при сбое не остался недописанный .atlas
+        temp_path = file_path.with_name(filename + ".tmp")
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                # write без буферизованного файлового объекта; os.write может
+                # записать не все байты, поэтому дописываем остаток
+                data = memoryview(atlas_code.encode('utf-8'))
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            # Не оставляем временный файл в папке макросов
+            temp_path.unlink(missing_ok=True)
+            raise
         
         print(f"💾 Макрос сохранен: {file_path}")
         return file_path
     
     def get_available_templates(self) -> list:
         """Получение списка доступных шаблонов из справочника"""
-        templates = []
-        
-        # Парсим справочник для извлечения имен шаблонов
-        lines = self.dsl_reference.split('\n')
-        in_templates_section = False
+        # Справочник разбирается один раз после загрузки
+        if self._available_templates is None:
+            self._available_templates = self._parse_available_templates()
+        return list(self._available_templates)
+    
+    def _parse_available_templates(self) -> list:
+        """Извлечение имен шаблонов из текста справочника"""
+        # Ищем заголовок раздела шаблонов
+        header_positions = [
+            position for position in (
+                self.dsl_reference.find('ДОСТУПНЫЕ ШАБЛОНЫ'),
+                self.dsl_reference.find('AVAILABLE TEMPLATES'),
+            )
+            if position != -1
+        ]
+        if not header_positions:
+            return []
         
-        for line in lines:
-            if 'ДОСТУПНЫЕ ШАБЛОНЫ' in line or 'AVAILABLE TEMPLATES' in line:
-                in_templates_section = True
-                continue
-            
-            if in_templates_section and line.strip().startswith('•'):
-                template_name = line.strip()[1:].strip()
-                if template_name:
-                    templates.append(template_name)
+        # Все пункты списка после строки заголовка - одним проходом regex
+        header_end = self.dsl_reference.find('\n', min(header_positions))
+        if header_end == -1:
+            return []
         
-        return templates
+        return [
+            match.group(1) or match.group(2)
+            for match in _TEMPLATE_BULLET_RE.finditer(self.dsl_reference, header_end)
+        ]
+    
+    def _get_template_names(self) -> frozenset:
+        """Кэшированное множество имен шаблонов (для быстрой проверки в validate_atlas_code)"""
+        if self._template_names is None:
+            self._template_names = frozenset(self.get_available_templates())
+        return self._template_names
     
     def validate_atlas_code(self, atlas_code: str) -> Dict[str, Any]:
         """Простая валидация .atlas кода"""
         errors = []
         warnings = []
         
-        lines = atlas_code.split('\n')
-        available_templates = self.get_available_templates()
+        lines_count = 0
+        available_templates = self._get_template_names()
         
-        for i, line in enumerate(lines, 1):
+        for i, line in enumerate(atlas_code.split('\n'), 1):
             line = line.strip()
             
-            if not line or line.startswith('#'):
+            if not line or line[0] == '#':
                 continue
+            lines_count += 1
             
-            # Проверяем команды
-            if line.startswith('click ') or line.startswith('open '):
-                parts = line.split(' ', 1)
-                if len(parts) > 1:
-                    template = parts[1]
-                    if template not in available_templates and not template.startswith('('):
-                        warnings.append(f"Строка {i}: Шаблон '{template}' не найден в справочнике")
-            
-            # Проверяем синтаксис wait
-            if line.startswith('wait '):
-                duration = line.split(' ', 1)[1] if ' ' in line else ''
-                if not re.match(r'^\d+(\.\d+)?(s|ms)$', duration):
-                    errors.append(f"Строка {i}: Неверный формат времени '{duration}'. Используйте: 3s, 1.5s, 500ms")
+            # Команды без аргумента не проверяем
+            command, _, argument = line.partition(' ')
+            validator = _LINE_VALIDATORS.get(command)
+            if validator and argument:
+                validator(argument, i, errors, warnings, available_templates)
         
         return {
             "valid": len(errors) == 0,
             "errors": errors,
             "warnings": warnings,
-            "lines_count": len([l for l in lines if l.strip() and not l.strip().startswith('#')])
+            "lines_count": lines_count
         }
 
 # Пример использования
@@ -678,8 +874,9 @@ if __name__ == "__main__":
             print(f"   ✅ Успех: {result['file_path']}")
             print(f"   ⚡ Время: {result['execution_time']:.3f}с")
             print(f"   📝 Код:")
-            print("   " + "\n   ".join(result["atlas_code"].split('\n')[:10]))
-            if len(result["atlas_code"].split('\n')) > 10:
+            code_lines = result["atlas_code"].split('\n')
+            print("   " + "\n   ".join(code_lines[:10]))
+            if len(code_lines) > 10:
                 print("   ...")
         else:
             print(f"   ❌ Ошибка: {result.get('error', 'Неизвестная ошибка')}")
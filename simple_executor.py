@@ -4,13 +4,81 @@
 Читает .atlas файлы и выполняет команды через CV + DOM + System
 """
 
+import os
 import time
 import re
 import subprocess
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 
+# Разбор аргументов команд (компилируются один раз при импорте)
+_TYPE_TEXT_RE = re.compile(r'"([^"]*)"')
+_COORD_RE = re.compile(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+_DURATION_RE = re.compile(r'^([\d.]+)\s*(ms|s)?$')
+_VARIABLE_RE = re.compile(r'\$\{(\w+)\}')
+
+# Ожидания короче 10 мс выдерживаются циклом по perf_counter, а не time.sleep;
+# о паузах короче 50 мс не печатаем (print дольше самой паузы)
+_SPIN_WAIT_LIMIT = 0.010
+_QUIET_WAIT_LIMIT = 0.050
+
+# Текст от этой длины вводится вставкой из буфера обмена (если доступен AppKit)
+_PASTE_MIN_LENGTH = 8
+# Пауза после Cmd+V перед возвратом прежнего содержимого буфера:
+# приложение читает буфер асинхронно, уже после нажатия
+_PASTE_RESTORE_DELAY = 0.15
+
+# Маппинг имен приложений
+_APP_MAPPING = MappingProxyType({
+    'ChromeApp': 'Google Chrome',
+    'Chrome': 'Google Chrome',
+    'Calculator': 'Calculator',
+    'Finder': 'Finder',
+    'Safari': 'Safari',
+    'TextEdit': 'TextEdit'
+})
+
+# Направления прокрутки
+_VERTICAL_SCROLL = frozenset(('up', 'down'))
+_HORIZONTAL_SCROLL = frozenset(('left', 'right'))
+
+# Поиск шаблона от грубого к точному: сначала на уменьшенном скриншоте,
+# затем уточнение в небольшой области полного разрешения
+_PYRAMID_SCALE = 0.25
+_PYRAMID_MIN_TEMPLATE_SIDE = 32  # Меньшие шаблоны ищем сразу в полном разрешении
+_PYRAMID_ROI_PADDING = 16
+_PYRAMID_THRESHOLD_MARGIN = 0.05  # Грубый проход допускает чуть меньшую уверенность
+_PYRAMID_VERIFY_BAND = 0.05  # Чуть ниже этой границы - проверка полным поиском
+
+# Операции скомпилированного .atlas макроса
+_OP_CALL, _OP_REPEAT, _OP_END = range(3)
+
+def _noop():
+    """Замена ленивого импорта после того, как модуль уже загружен"""
+
+def _iter_png_files(root) -> Iterator[str]:
+    """
+    Пути PNG файлов в дереве каталогов через os.scandir
+    
+    Порядок как у Path.rglob("*.png"): файлы каталога, затем подкаталоги
+    (символические ссылки на каталоги не обходятся)
+    """
+    try:
+        with os.scandir(root) as entries:
+            subdirs = []
+            for entry in entries:
+                if entry.name.endswith('.png') and entry.is_file():
+                    yield entry.path
+                elif entry.is_dir() and not entry.is_symlink():
+                    subdirs.append(entry.path)
+    except OSError:
+        return
+    
+    for subdir in subdirs:
+        yield from _iter_png_files(subdir)
+
 @dataclass
 class ExecutionResult:
     """Результат выполнения команды"""
@@ -23,23 +91,68 @@ class SimpleExecutor:
     Простой исполнитель .atlas макросов
     """
     
-    def __init__(self, templates_dir: str = "templates"):
+    def __init__(self, templates_dir: str = "templates", verbose: Optional[bool] = None):
         """
         Инициализация исполнителя
         
         Args:
             templates_dir: Путь к шаблонам для CV
+            verbose: Печатать ход выполнения каждой команды (по умолчанию из MACRO_VERBOSE,
+                     MACRO_VERBOSE=0 оставляет только ошибки)
         """
         self.templates_dir = Path(templates_dir)
+        # Как в SimpleExecutorEnhanced: подробный вывод, если MACRO_VERBOSE не равен 0
+        if verbose is None:
+            verbose = os.environ.get('MACRO_VERBOSE', '1') != '0'
+        self.verbose = verbose
         
         # Ленивая загрузка зависимостей
         self.pyautogui = None
         self.cv2 = None
+        self.np = None
         self.selenium_driver = None
+        # Захват экрана через mss (None - не загружен, False - недоступен)
+        self.screen_grabber = None
+        # NSWorkspace для запуска приложений (None - не загружен, False - PyObjC недоступен)
+        self.workspace = None
+        self.pasteboard = None
+        # Quartz для событий мыши (None - не загружен, False - недоступен)
+        self.quartz = None
+        
+        # Кэш поиска шаблонов: индекс файлов и результаты по имени
+        self._template_index: Optional[Dict[str, Path]] = None
+        self._template_cache: Dict[str, Path] = {}  # промахи не запоминаются
+        # Декодированные изображения шаблонов: (путь, флаг cv2.imread) -> (mtime, ndarray),
+        # уменьшенные копии для пирамиды: (путь, 'pyramid') -> ndarray
+        self._template_images: Dict[tuple, Any] = {}
+        
+        # Масштаб дисплея (Retina) не меняется за сессию
+        self._display_scale: Optional[float] = None
+        
+        # Разобранные аргументы повторяющихся команд hotkey/scroll
+        self._hotkey_cache: Dict[str, tuple] = {}
+        self._scroll_cache: Dict[str, Tuple[str, int]] = {}
         
         # Переменные выполнения
         self.variables = {}
         
+        # Обработчики команд по первому слову
+        self._command_handlers = {
+            'open': self._execute_open,
+            'click': self._execute_click,
+            'type': self._execute_type_command,
+            'wait': self._execute_wait,
+            'press': self._execute_press,
+            'hotkey': self._execute_hotkey,
+            'scroll': self._execute_scroll,
+            'repeat': self._execute_repeat,
+        }
+        
+        # ATLAS_EAGER=1: загрузить зависимости сразу (в CI отсутствующие пакеты видны до выполнения)
+        if os.environ.get('ATLAS_EAGER') == '1':
+            self._lazy_import_pyautogui()
+            self._lazy_import_cv2()
+        
         print("⚡ SimpleExecutor инициализирован")
     
     def _lazy_import_pyautogui(self):
@@ -50,24 +163,72 @@ class SimpleExecutor:
                 self.pyautogui = pyautogui
                 # Отключаем fail-safe
                 self.pyautogui.FAILSAFE = False
+                # Дальше проверка не нужна: метод заменяется пустой функцией
+                self._lazy_import_pyautogui = _noop
                 print("📦 PyAutoGUI загружен")
             except ImportError:
                 print("❌ PyAutoGUI не установлен. Установите: pip install pyautogui")
                 raise
     
+    def _lazy_import_numpy(self):
+        """Ленивый импорт NumPy"""
+        if self.np is None:
+            try:
+                import numpy as np
+                self.np = np
+                self._lazy_import_numpy = _noop
+            except ImportError:
+                print("❌ NumPy не установлен. Установите: pip install numpy")
+                raise
+    
     def _lazy_import_cv2(self):
         """Ленивый импорт OpenCV"""
         if self.cv2 is None:
+            self._lazy_import_numpy()
             try:
                 import cv2
-                import numpy as np
                 self.cv2 = cv2
-                self.np = np
+                self._lazy_import_cv2 = _noop
                 print("📦 OpenCV загружен")
             except ImportError:
                 print("❌ OpenCV не установлен. Установите: pip install opencv-python")
                 raise
     
+    def _lazy_import_mss(self) -> bool:
+        """Ленивый импорт mss (опционально, иначе скриншоты через PyAutoGUI)"""
+        if self.screen_grabber is None:
+            try:
+                import mss
+                # Один экземпляр на все время работы исполнителя
+                self.screen_grabber = mss.mss()
+                print("📦 mss загружен")
+            except ImportError:
+                self.screen_grabber = False
+        return self.screen_grabber is not False
+    
+    def _lazy_import_appkit(self) -> bool:
+        """Ленивый импорт AppKit (опционально: запуск приложений и буфер обмена)"""
+        if self.workspace is None:
+            try:
+                from AppKit import NSWorkspace, NSPasteboard, NSPasteboardItem, NSPasteboardTypeString
+                self.workspace = NSWorkspace.sharedWorkspace()
+                self.pasteboard = NSPasteboard.generalPasteboard()
+                self._pasteboard_item_class = NSPasteboardItem
+                self._pasteboard_string_type = NSPasteboardTypeString
+            except ImportError:
+                self.workspace = False
+        return self.workspace is not False
+    
+    def _lazy_import_quartz(self) -> bool:
+        """Ленивый импорт Quartz (опционально, иначе клики через PyAutoGUI)"""
+        if self.quartz is None:
+            try:
+                import Quartz
+                self.quartz = Quartz
+            except ImportError:
+                self.quartz = False
+        return self.quartz is not False
+    
     def execute_atlas_file(self, file_path: str) -> ExecutionResult:
         """
         Выполнение .atlas файла
@@ -131,17 +292,49 @@ class SimpleExecutor:
             
             print(f"📋 Найдено команд: {len(commands)}")
             
+            # Разбираем команды один раз, циклы превращаются в переходы
+            ops = self._compile_atlas(commands)
+            loop_stack = []  # [индекс repeat, оставшиеся итерации]
+            
             # Выполняем команды
-            for i, command in enumerate(commands, 1):
-                print(f"🔧 Команда {i}/{len(commands)}: {command}")
+            position = 0
+            while position < len(ops):
+                opcode, payload = ops[position]
+                command = commands[position]
+                if self.verbose:
+                    print(f"🔧 Команда {position + 1}/{len(commands)}: {command}")
+                
+                if opcode == _OP_CALL:
+                    handler, args = payload
+                    try:
+                        result = handler(args)
+                    except Exception as e:
+                        result = ExecutionResult(False, f"Ошибка выполнения команды '{command}': {e}")
+                    
+                    if not result.success:
+                        return ExecutionResult(
+                            success=False,
+                            message=f"Ошибка на команде {position + 1}: {result.message}"
+                        )
                 
-                result = self._execute_command(command)
+                elif opcode == _OP_REPEAT:
+                    count, end_position = payload
+                    if count == 0:
+                        # Пустой цикл - сразу за его end
+                        position = end_position + 1
+                        continue
+                    loop_stack.append([position, count])
                 
-                if not result.success:
-                    return ExecutionResult(
-                        success=False,
-                        message=f"Ошибка на команде {i}: {result.message}"
-                    )
+                else:  # _OP_END
+                    loop = loop_stack[-1]
+                    loop[1] -= 1
+                    if loop[1] > 0:
+                        # Следующая итерация: переход к первой команде тела
+                        position = loop[0] + 1
+                        continue
+                    loop_stack.pop()
+                
+                position += 1
             
             return ExecutionResult(
                 success=True,
@@ -156,98 +349,109 @@ class SimpleExecutor:
     
     def _parse_atlas_content(self, content: str) -> List[str]:
         """Парсинг .atlas содержимого в команды"""
-        lines = content.split('\n')
-        commands = []
+        # Одна strip() на строку; пустые строки и комментарии пропускаются
+        return [
+            line for raw_line in content.split('\n')
+            if (line := raw_line.strip()) and line[0] != '#'
+        ]
+    
+    def _compile_atlas(self, commands: List[str]) -> List[tuple]:
+        """
+        Компиляция команд в операции (по одной на команду, тот же порядок)
         
-        for line in lines:
-            line = line.strip()
-            
-            # Пропускаем пустые строки и комментарии
-            if not line or line.startswith('#'):
+        Операции:
+            (_OP_CALL, (обработчик, аргумент)) - вызов обработчика команды
+            (_OP_REPEAT, (количество, индекс end)) - начало цикла "repeat N:"
+            (_OP_END, индекс repeat) - конец цикла, переход назад
+        """
+        ops = []
+        open_loops = []
+        
+        for command in commands:
+            if command == 'end' and open_loops:
+                start = open_loops.pop()
+                ops[start] = (_OP_REPEAT, (ops[start][1], len(ops)))
+                ops.append((_OP_END, start))
                 continue
             
-            commands.append(line)
+            verb, separator, args = command.partition(' ')
+            if verb == 'repeat' and separator:
+                count = args.strip().rstrip(':').strip()
+                if count.isdigit():
+                    # Индекс end подставляется, когда цикл закроется
+                    open_loops.append(len(ops))
+                    ops.append((_OP_REPEAT, int(count)))
+                    continue
+            
+            ops.append((_OP_CALL, self._resolve_command(command)))
+        
+        # repeat без end - пропускается, тело выполняется один раз
+        for start in open_loops:
+            ops[start] = (_OP_CALL, self._resolve_command(commands[start]))
+        
+        return ops
+    
+    def _resolve_command(self, command: str) -> tuple:
+        """Обработчик команды и его аргумент"""
+        if command == 'end':
+            return self._execute_end, command
+        
+        # Команда и ее аргументы: одно разбиение и поиск обработчика в таблице
+        verb, separator, args = command.partition(' ')
+        handler = self._command_handlers.get(verb) if separator else None
+        
+        if handler is None:
+            return self._skip_unknown_command, command
         
-        return commands
+        return handler, args.strip()
     
     def _execute_command(self, command: str) -> ExecutionResult:
         """Выполнение одной команды"""
         try:
             command = command.strip()
-            
-            # 1. Команды открытия приложений
-            if command.startswith('open '):
-                app_name = command[5:].strip()
-                return self._execute_open(app_name)
-            
-            # 2. Команды кликов
-            elif command.startswith('click '):
-                target = command[6:].strip()
-                return self._execute_click(target)
-            
-            # 3. Ввод текста
-            elif command.startswith('type '):
-                text_match = re.match(r'type\s+"([^"]*)"', command)
-                if text_match:
-                    text = text_match.group(1)
-                    return self._execute_type(text)
-                else:
-                    return ExecutionResult(False, f"Неверный формат команды type: {command}")
-            
-            # 4. Ожидание
-            elif command.startswith('wait '):
-                duration = command[5:].strip()
-                return self._execute_wait(duration)
-            
-            # 5. Нажатие клавиш
-            elif command.startswith('press '):
-                key = command[6:].strip()
-                return self._execute_press(key)
-            
-            # 6. Горячие клавиши
-            elif command.startswith('hotkey '):
-                hotkey = command[7:].strip()
-                return self._execute_hotkey(hotkey)
-            
-            # 7. Прокрутка
-            elif command.startswith('scroll '):
-                scroll_params = command[7:].strip()
-                return self._execute_scroll(scroll_params)
-            
-            # 8. Циклы
-            elif command.startswith('repeat '):
-                # TODO: Реализовать циклы
-                return ExecutionResult(True, f"Repeat команда пропущена (не реализована): {command}")
-            
-            elif command == 'end':
-                return ExecutionResult(True, "End команда")
-            
-            # 9. Неизвестная команда
-            else:
-                return ExecutionResult(True, f"Неизвестная команда пропущена: {command}")
+            handler, args = self._resolve_command(command)
+            return handler(args)
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка выполнения команды '{command}': {e}")
     
+    def _execute_end(self, command: str) -> ExecutionResult:
+        """end вне цикла"""
+        return ExecutionResult(True, "End команда")
+    
+    def _skip_unknown_command(self, command: str) -> ExecutionResult:
+        """Неизвестная команда"""
+        return ExecutionResult(True, f"Неизвестная команда пропущена: {command}")
+    
+    def _execute_type_command(self, args: str) -> ExecutionResult:
+        """Команда type с текстом в кавычках"""
+        text_match = _TYPE_TEXT_RE.match(args)
+        if text_match:
+            return self._execute_type(text_match.group(1))
+        return ExecutionResult(False, f"Неверный формат команды type: type {args}")
+    
+    def _execute_repeat(self, repeat_params: str) -> ExecutionResult:
+        """
+        Команда repeat без парного end
+        
+        Циклы с end выполняет execute_atlas_content (см. _compile_atlas), сюда попадает
+        только незакрытый repeat: он пропускается, команды после него выполняются один раз
+        """
+        return ExecutionResult(True, f"repeat без end пропущен, команды выполнены один раз: repeat {repeat_params}")
+    
     def _execute_open(self, app_name: str) -> ExecutionResult:
         """Открытие приложения"""
         try:
-            # Маппинг имен приложений
-            app_mapping = {
-                'ChromeApp': 'Google Chrome',
-                'Chrome': 'Google Chrome',
-                'Calculator': 'Calculator',
-                'Finder': 'Finder',
-                'Safari': 'Safari',
-                'TextEdit': 'TextEdit'
-            }
-            
-            actual_app_name = app_mapping.get(app_name, app_name)
-            
-            # Используем системную команду open на macOS
-            subprocess.run(['open', '-a', actual_app_name], check=True)
-            
-            print(f"✅ Приложение открыто: {actual_app_name}")
+            actual_app_name = _APP_MAPPING.get(app_name, app_name)
+            
+            # Запрос напрямую в Launch Services, без процесса /usr/bin/open
+            launched = self._lazy_import_appkit() and self.workspace.launchApplication_(actual_app_name)
+            if not launched:
+                # Используем системную команду open на macOS
+                subprocess.run(['open', '-a', actual_app_name], check=True)
+            
+            if self.verbose:
+                print(f"✅ Приложение открыто: {actual_app_name}")
             return ExecutionResult(True, f"Приложение {actual_app_name} открыто")
         
         except subprocess.CalledProcessError as e:
@@ -259,7 +463,7 @@ class SimpleExecutor:
         """Выполнение клика"""
         try:
             # Проверяем координаты: click (x, y)
-            coord_match = re.match(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)', target)
+            coord_match = _COORD_RE.match(target)
             if coord_match:
                 x, y = map(int, coord_match.groups())
                 return self._click_coordinates(x, y)
@@ -273,15 +477,28 @@ class SimpleExecutor:
     def _click_coordinates(self, x: int, y: int) -> ExecutionResult:
         """Клик по координатам"""
         try:
-            self._lazy_import_pyautogui()
-            
-            self.pyautogui.click(x, y)
-            print(f"🖱️ Клик по координатам ({x}, {y})")
+            self._click(x, y)
+            if self.verbose:
+                print(f"🖱️ Клик по координатам ({x}, {y})")
             return ExecutionResult(True, f"Клик по координатам ({x}, {y})")
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка клика по координатам: {e}")
     
+    def _click(self, x: int, y: int):
+        """Левый клик: событиями Quartz напрямую, иначе через PyAutoGUI"""
+        if self._lazy_import_quartz():
+            quartz = self.quartz
+            position = (x, y)
+            # Перемещение, нажатие и отпускание - без паузы pyautogui.PAUSE
+            for event_type in (quartz.kCGEventMouseMoved, quartz.kCGEventLeftMouseDown, quartz.kCGEventLeftMouseUp):
+                event = quartz.CGEventCreateMouseEvent(None, event_type, position, quartz.kCGMouseButtonLeft)
+                quartz.CGEventPost(quartz.kCGHIDEventTap, event)
+            return
+        
+        self._lazy_import_pyautogui()
+        self.pyautogui.click(x, y)
+    
     def _click_template(self, template_name: str) -> ExecutionResult:
         """Клик по шаблону через улучшенный Computer Vision"""
         try:
@@ -297,10 +514,10 @@ class SimpleExecutor:
             
             if found:
                 x, y = coords
-                self._lazy_import_pyautogui()
-                self.pyautogui.click(x, y)
-                print(f"✅ Шаблон найден с уверенностью {score:.3f}")
-                print(f"🖱️ Клик по шаблону {template_name} в ({x}, {y})")
+                self._click(x, y)
+                if self.verbose:
+                    print(f"✅ Шаблон найден с уверенностью {score:.3f}")
+                    print(f"🖱️ Клик по шаблону {template_name} в ({x}, {y})")
                 return ExecutionResult(True, f"Клик по шаблону {template_name}")
             else:
                 print(f"⚠️ Низкая уверенность поиска: {score:.3f}")
@@ -312,24 +529,142 @@ class SimpleExecutor:
     
     def _find_template(self, template_name: str) -> Optional[Path]:
         """Поиск файла шаблона"""
-        # Возможные имена файлов
-        possible_names = [
-            f"{template_name}.png",
-            f"{template_name}-btn.png",
-            f"{template_name}_btn.png"
-        ]
+        # Найденный путь кэшируется на сессию
+        if template_name in self._template_cache:
+            return self._template_cache[template_name]
+        
+        index_was_built = self._template_index is not None
+        template_path = self._lookup_template(template_name)
+        
+        if template_path is None and index_was_built:
+            # Шаблон могли добавить после построения индекса: один повторный обход,
+            # найденные ранее пути ищутся заново по новому индексу
+            self._template_index = None
+            self._template_cache.clear()
+            template_path = self._lookup_template(template_name)
+        
+        # Промах не запоминается: снятый позже шаблон найдется без перезапуска
+        if template_path is not None:
+            self._template_cache[template_name] = template_path
+        return template_path
+    
+    def _lookup_template(self, template_name: str) -> Optional[Path]:
+        """Поиск шаблона в индексе: точное имя и варианты, затем частичное совпадение"""
+        template_index = self._get_template_index()
         
-        # Ищем в директории шаблонов
-        for name in possible_names:
-            for template_file in self.templates_dir.rglob(name):
-                return template_file
+        # Возможные имена файлов
+        possible_stems = (template_name, f"{template_name}-btn", f"{template_name}_btn")
+        template_path = next(
+            (template_index[stem] for stem in possible_stems if stem in template_index),
+            None
+        )
         
         # Ищем по частичному совпадению
-        for template_file in self.templates_dir.rglob("*.png"):
-            if template_name.lower() in template_file.stem.lower():
-                return template_file
+        if template_path is None:
+            name_lower = template_name.lower()
+            template_path = next(
+                (path for stem, path in template_index.items() if name_lower in stem.lower()),
+                None
+            )
+        
+        return template_path
+    
+    def _get_template_index(self) -> Dict[str, Path]:
+        """Индекс PNG шаблонов по имени файла (строится один раз при первом поиске)"""
+        if self._template_index is None:
+            self._template_index = {}
+            for file_path in _iter_png_files(self.templates_dir):
+                # Первый найденный файл с таким именем, как и при поиске через rglob
+                stem = os.path.splitext(os.path.basename(file_path))[0]
+                if stem not in self._template_index:
+                    self._template_index[stem] = Path(file_path)
+        return self._template_index
+    
+    def _load_template_image(self, template_path: Path, flags: int):
+        """Загрузка изображения шаблона (PNG декодируется заново только после изменения файла)"""
+        key = (str(template_path), flags)
+        try:
+            mtime = template_path.stat().st_mtime
+        except OSError:
+            return None
+        
+        cached = self._template_images.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
         
-        return None
+        template = self.cv2.imread(key[0], flags)
+        if template is not None:
+            self._template_images[key] = (mtime, template)
+            # Уменьшенная копия для пирамиды строилась по старому файлу
+            self._template_images.pop((key[0], 'pyramid'), None)
+        return template
+    
+    def _grab_screen_gray(self):
+        """Скриншот основного экрана в оттенках серого (физическое разрешение)"""
+        if self._lazy_import_mss():
+            # mss читает кадр напрямую, без временного файла screencapture
+            raw = self.screen_grabber.grab(self.screen_grabber.monitors[1])
+            frame = self.np.frombuffer(raw.bgra, dtype=self.np.uint8).reshape(raw.height, raw.width, 4)
+            return self.cv2.cvtColor(frame, self.cv2.COLOR_BGRA2GRAY)
+        
+        screenshot = self.pyautogui.screenshot()
+        frame = self.np.array(screenshot)
+        # Сразу RGB -> GRAY, без промежуточного BGR кадра
+        return self.cv2.cvtColor(frame, self.cv2.COLOR_RGB2GRAY)
+    
+    def _match_template(self, gray, template, template_path: Path,
+                        threshold: float) -> Tuple[float, Tuple[int, int]]:
+        """
+        Сопоставление шаблона со скриншотом (оба в оттенках серого)
+        
+        Returns:
+            (лучшая уверенность, левый верхний угол совпадения)
+        """
+        template_height, template_width = template.shape[:2]
+        
+        if min(template_height, template_width) >= _PYRAMID_MIN_TEMPLATE_SIDE:
+            # Грубый проход: в 16 раз меньше пикселей
+            small_key = (str(template_path), 'pyramid')
+            small_template = self._template_images.get(small_key)
+            if small_template is None:
+                small_template = self.cv2.resize(
+                    template, None, fx=_PYRAMID_SCALE, fy=_PYRAMID_SCALE,
+                    interpolation=self.cv2.INTER_AREA
+                )
+                self._template_images[small_key] = small_template
+            small_gray = self.cv2.resize(
+                gray, None, fx=_PYRAMID_SCALE, fy=_PYRAMID_SCALE,
+                interpolation=self.cv2.INTER_AREA
+            )
+            res = self.cv2.matchTemplate(small_gray, small_template, self.cv2.TM_CCOEFF_NORMED)
+            _, coarse_val, _, coarse_loc = self.cv2.minMaxLoc(res)
+            coarse_gate = threshold - _PYRAMID_THRESHOLD_MARGIN
+            
+            if coarse_val < coarse_gate - _PYRAMID_VERIFY_BAND:
+                # Явный промах: без полного поиска, оценка с грубого прохода
+                return coarse_val, (int(coarse_loc[0] / _PYRAMID_SCALE), int(coarse_loc[1] / _PYRAMID_SCALE))
+            
+            if coarse_val >= coarse_gate:
+                # Уточняем в области вокруг найденного места в полном разрешении
+                screen_height, screen_width = gray.shape[:2]
+                x = int(coarse_loc[0] / _PYRAMID_SCALE)
+                y = int(coarse_loc[1] / _PYRAMID_SCALE)
+                x0 = max(0, x - _PYRAMID_ROI_PADDING)
+                y0 = max(0, y - _PYRAMID_ROI_PADDING)
+                x1 = min(screen_width, x + template_width + _PYRAMID_ROI_PADDING)
+                y1 = min(screen_height, y + template_height + _PYRAMID_ROI_PADDING)
+                
+                if x1 - x0 >= template_width and y1 - y0 >= template_height:
+                    res = self.cv2.matchTemplate(gray[y0:y1, x0:x1], template, self.cv2.TM_CCOEFF_NORMED)
+                    _, max_val, _, max_loc = self.cv2.minMaxLoc(res)
+                    # Оценка в полном разрешении окончательна: и совпадение, и промах
+                    return max_val, (max_loc[0] + x0, max_loc[1] + y0)
+        
+        # Полный поиск: маленький шаблон, грубая оценка у самой границы
+        # или область уточнения вышла за край кадра
+        res = self.cv2.matchTemplate(gray, template, self.cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = self.cv2.minMaxLoc(res)
+        return max_val, max_loc
     
     def _find_template_on_screen(self, template_path: Path) -> Optional[tuple]:
         """Поиск шаблона на экране через OpenCV"""
@@ -337,20 +672,17 @@ class SimpleExecutor:
             self._lazy_import_cv2()
             self._lazy_import_pyautogui()
             
-            # Делаем скриншот
-            screenshot = self.pyautogui.screenshot()
-            screenshot_np = self.np.array(screenshot)
-            screenshot_cv = self.cv2.cvtColor(screenshot_np, self.cv2.COLOR_RGB2BGR)
+            # Делаем скриншот (сопоставление в оттенках серого: один канал вместо трех)
+            screenshot_gray = self._grab_screen_gray()
             
             # Загружаем шаблон
-            template = self.cv2.imread(str(template_path))
+            template = self._load_template_image(template_path, self.cv2.IMREAD_GRAYSCALE)
             if template is None:
                 print(f"❌ Не удалось загрузить шаблон: {template_path}")
                 return None
             
             # Ищем шаблон
-            result = self.cv2.matchTemplate(screenshot_cv, template, self.cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = self.cv2.minMaxLoc(result)
+            max_val, max_loc = self._match_template(screenshot_gray, template, template_path, 0.8)
             
             # Проверяем уверенность
             if max_val >= 0.8:  # 80% уверенности
@@ -359,7 +691,8 @@ class SimpleExecutor:
                 center_x = max_loc[0] + template_width // 2
                 center_y = max_loc[1] + template_height // 2
                 
-                print(f"✅ Шаблон найден с уверенностью {max_val:.3f}")
+                if self.verbose:
+                    print(f"✅ Шаблон найден с уверенностью {max_val:.3f}")
                 return (center_x, center_y)
             else:
                 print(f"⚠️ Низкая уверенность поиска: {max_val:.3f}")
@@ -377,26 +710,67 @@ class SimpleExecutor:
             # Подстановка переменных
             text = self._substitute_variables(text)
             
-            self.pyautogui.typewrite(text)
-            print(f"⌨️ Введен текст: {text}")
+            if len(text) >= _PASTE_MIN_LENGTH and self._lazy_import_appkit():
+                # Длинный текст - одной вставкой из буфера обмена вместо события на каждый символ
+                saved_items = self._save_pasteboard()
+                self.pasteboard.clearContents()
+                self.pasteboard.setString_forType_(text, self._pasteboard_string_type)
+                try:
+                    self.pyautogui.hotkey('command', 'v')
+                    time.sleep(_PASTE_RESTORE_DELAY)
+                finally:
+                    # Возвращаем пользователю его буфер обмена
+                    self._restore_pasteboard(saved_items)
+            else:
+                self.pyautogui.typewrite(text)
+            if self.verbose:
+                print(f"⌨️ Введен текст: {text}")
             return ExecutionResult(True, f"Введен текст: {text}")
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка ввода текста: {e}")
     
+    def _save_pasteboard(self) -> List[Dict[str, Any]]:
+        """Копия содержимого буфера обмена: данные каждого элемента по типам"""
+        return [
+            {item_type: item.dataForType_(item_type) for item_type in item.types()}
+            for item in self.pasteboard.pasteboardItems() or ()
+        ]
+    
+    def _restore_pasteboard(self, saved_items: List[Dict[str, Any]]):
+        """Восстановление буфера обмена из копии _save_pasteboard"""
+        self.pasteboard.clearContents()
+        items = []
+        for item_data in saved_items:
+            item = self._pasteboard_item_class.alloc().init()
+            for item_type, data in item_data.items():
+                if data is not None:
+                    item.setData_forType_(data, item_type)
+            items.append(item)
+        if items:
+            self.pasteboard.writeObjects_(items)
+    
     def _execute_wait(self, duration: str) -> ExecutionResult:
         """Ожидание"""
         try:
-            # Парсим длительность
-            if duration.endswith('s'):
-                seconds = float(duration[:-1])
-            elif duration.endswith('ms'):
-                seconds = float(duration[:-2]) / 1000
+            # Парсим длительность: 3s, 1.5s, 500ms или просто секунды
+            duration_match = _DURATION_RE.match(duration.strip())
+            if not duration_match:
+                return ExecutionResult(False, f"Неверный формат времени: {duration}")
+            
+            seconds = float(duration_match.group(1))
+            if duration_match.group(2) == 'ms':
+                seconds /= 1000
+            
+            if seconds < _SPIN_WAIT_LIMIT:
+                # Короткие паузы между нажатиями: sleep округляется до кванта планировщика
+                deadline = time.perf_counter() + seconds
+                while time.perf_counter() < deadline:
+                    pass
             else:
-                seconds = float(duration)
-            
-            print(f"⏳ Ожидание {seconds}с...")
-            time.sleep(seconds)
+                if self.verbose and seconds >= _QUIET_WAIT_LIMIT:
+                    print(f"⏳ Ожидание {seconds}с...")
+                time.sleep(seconds)
             return ExecutionResult(True, f"Ожидание {seconds}с")
         
         except Exception as e:
@@ -408,7 +782,8 @@ class SimpleExecutor:
             self._lazy_import_pyautogui()
             
             self.pyautogui.press(key)
-            print(f"⌨️ Нажата клавиша: {key}")
+            if self.verbose:
+                print(f"⌨️ Нажата клавиша: {key}")
             return ExecutionResult(True, f"Нажата клавиша: {key}")
         
         except Exception as e:
@@ -419,9 +794,12 @@ class SimpleExecutor:
         try:
             self._lazy_import_pyautogui()
             
-            keys = hotkey.split('+')
+            keys = self._hotkey_cache.get(hotkey)
+            if keys is None:
+                keys = self._hotkey_cache[hotkey] = tuple(hotkey.split('+'))
             self.pyautogui.hotkey(*keys)
-            print(f"⌨️ Горячие клавиши: {hotkey}")
+            if self.verbose:
+                print(f"⌨️ Горячие клавиши: {hotkey}")
             return ExecutionResult(True, f"Горячие клавиши: {hotkey}")
         
         except Exception as e:
@@ -432,49 +810,107 @@ class SimpleExecutor:
         try:
             self._lazy_import_pyautogui()
             
-            parts = scroll_params.split()
-            direction = parts[0] if parts else 'down'
-            amount = int(parts[1]) if len(parts) > 1 else 3
+            parsed = self._scroll_cache.get(scroll_params)
+            if parsed is None:
+                parts = scroll_params.split()
+                direction = parts[0] if parts else 'down'
+                amount = int(parts[1]) if len(parts) > 1 else 3
+                parsed = self._scroll_cache[scroll_params] = (direction, amount)
+            direction, amount = parsed
             
-            if direction in ['up', 'down']:
+            if direction in _VERTICAL_SCROLL:
                 scroll_amount = amount if direction == 'down' else -amount
                 self.pyautogui.scroll(scroll_amount)
+            elif direction in _HORIZONTAL_SCROLL:
+                # Горизонтальная прокрутка (не все системы поддерживают)
+                self.pyautogui.hscroll(amount if direction == 'right' else -amount)
+            
+            if self.verbose:
+                print(f"📜 Прокрутка: {direction} {amount}")
+            return ExecutionResult(True, f"Прокрутка {direction}")
         
-        # Конвертируем в OpenCV формат
-        import numpy as np
-        frame = np.array(screenshot)
-        frame = self.cv2.cvtColor(frame, self.cv2.COLOR_RGB2BGR)
-        gray = self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2GRAY)
+        except Exception as e:
+            return ExecutionResult(False, f"Ошибка прокрутки: {e}")
+    
+    def _find_template_with_retry(self, template_path: Path, timeout: float = 5.0,
+                                  threshold: float = 0.8) -> Tuple[bool, Optional[Tuple[int, int]], float]:
+        """Поиск шаблона на экране с повторными попытками"""
+        start_time = time.time()
+        last_score = 0.0
         
-        # Template matching
-        res = self.cv2.matchTemplate(gray, template, self.cv2.TM_CCOEFF_NORMED)
-        min_val, max_val, min_loc, max_loc = self.cv2.minMaxLoc(res)
+        while time.time() - start_time < timeout:
+            found, coords, score = self._find_template_advanced(template_path, threshold)
+            last_score = score
+            
+            if found:
+                return True, coords, score
+            
+            time.sleep(0.5)  # Пауза между попытками
         
-        if max_val >= threshold:
-            h, w = template.shape
+        return False, None, last_score
+    
+    def _find_template_advanced(self, template_path: Path,
+                                threshold: float = 0.8) -> Tuple[bool, Optional[Tuple[int, int]], float]:
+        """Продвинутый поиск шаблона с обработкой Retina дисплеев"""
+        try:
+            self._lazy_import_cv2()
+            self._lazy_import_pyautogui()
             
-            # Вычисляем центр
-            center_x = max_loc[0] + w // 2
-            center_y = max_loc[1] + h // 2
+            # Загружаем шаблон
+            template = self._load_template_image(template_path, self.cv2.IMREAD_GRAYSCALE)
+            if template is None:
+                return False, None, 0.0
             
-            # Определяем масштаб дисплея (Retina)
-            display_scale = self._get_display_scale()
+            # Захват экрана
+            gray = self._grab_screen_gray()
             
-            # Корректируем координаты для pyautogui.click()
-            center_x = int(center_x / display_scale)
-            center_y = int(center_y / display_scale)
+            # Template matching
+            max_val, max_loc = self._match_template(gray, template, template_path, threshold)
             
-            return True, (center_x, center_y), max_val
+            if max_val >= threshold:
+                h, w = template.shape
+                
+                # Вычисляем центр
+                center_x = max_loc[0] + w // 2
+                center_y = max_loc[1] + h // 2
+                
+                # Определяем масштаб дисплея (Retina)
+                display_scale = self._get_display_scale()
+                
+                # Корректируем координаты для pyautogui.click()
+                center_x = int(center_x / display_scale)
+                center_y = int(center_y / display_scale)
+                
+                return True, (center_x, center_y), max_val
+            
+            return False, None, max_val
         
-        return False, None, max_val
+        except Exception as e:
+            print(f"❌ Ошибка продвинутого поиска: {e}")
+            return False, None, 0.0
     
-    except Exception as e:
-        print(f"❌ Ошибка продвинутого поиска: {e}")
-        return False, None, 0.0
-
-def _get_display_scale(self):
-    """Определение масштаба дисплея (Retina)"""
-    try:
+    def _get_display_scale(self):
+        """Определение масштаба дисплея (Retina), один раз за сессию"""
+        if self._display_scale is None:
+            try:
+                self._display_scale = self._detect_display_scale()
+            except:
+                return 1.0
+        return self._display_scale
+    
+    def _detect_display_scale(self) -> float:
+        """Отношение физического разрешения основного дисплея к логическому"""
+        try:
+            # Режим дисплея через Quartz - без скриншота
+            from Quartz import (CGMainDisplayID, CGDisplayCopyDisplayMode,
+                                CGDisplayModeGetWidth, CGDisplayModeGetPixelWidth)
+            mode = CGDisplayCopyDisplayMode(CGMainDisplayID())
+            logical_width = CGDisplayModeGetWidth(mode)
+            if logical_width:
+                return CGDisplayModeGetPixelWidth(mode) / logical_width
+        except ImportError:
+            pass
+        
         self._lazy_import_pyautogui()
         
         screen_size = self.pyautogui.size()
@@ -482,98 +918,21 @@ def _get_display_scale(self):
         
         # Если физическое разрешение больше логического - это Retina
         if screenshot.width != screen_size.width:
-            scale = screenshot.width / screen_size.width
-            return scale
+            return screenshot.width / screen_size.width
         
         return 1.0
-    except:
-        return 1.0
-
-def _execute_type(self, text: str) -> ExecutionResult:
-    """Ввод текста"""
-    try:
-        self._lazy_import_pyautogui()
-        
-        # Подстановка переменных
-        text = self._substitute_variables(text)
-        
-        self.pyautogui.typewrite(text)
-        print(f"⌨️ Введен текст: {text}")
-        return ExecutionResult(True, f"Введен текст: {text}")
-        
-    except Exception as e:
-        return ExecutionResult(False, f"Ошибка ввода текста: {e}")
-
-def _execute_wait(self, duration: str) -> ExecutionResult:
-    """Ожидание"""
-    try:
-        # Парсим длительность
-        if duration.endswith('s'):
-            seconds = float(duration[:-1])
-        elif duration.endswith('ms'):
-            seconds = float(duration[:-2]) / 1000
-        else:
-            seconds = float(duration)
-        
-        print(f"⏳ Ожидание {seconds}с...")
-        time.sleep(seconds)
-        return ExecutionResult(True, f"Ожидание {seconds}с")
-        
-    except Exception as e:
-        return ExecutionResult(False, f"Ошибка ожидания: {e}")
-
-def _execute_press(self, key: str) -> ExecutionResult:
-    """Нажатие клавиши"""
-    try:
-        self._lazy_import_pyautogui()
-        
-        self.pyautogui.press(key)
-        print(f"⌨️ Нажата клавиша: {key}")
-        return ExecutionResult(True, f"Нажата клавиша: {key}")
-        
-    except Exception as e:
-        return ExecutionResult(False, f"Ошибка нажатия клавиши: {e}")
-
-def _execute_hotkey(self, hotkey: str) -> ExecutionResult:
-    """Горячие клавиши"""
-    try:
-        self._lazy_import_pyautogui()
-        
-        keys = hotkey.split('+')
-        self.pyautogui.hotkey(*keys)
-        print(f"⌨️ Горячие клавиши: {hotkey}")
-        return ExecutionResult(True, f"Горячие клавиши: {hotkey}")
-        
-    except Exception as e:
-        return ExecutionResult(False, f"Ошибка горячих клавиш: {e}")
-
-def _execute_scroll(self, scroll_params: str) -> ExecutionResult:
-    """Прокрутка"""
-    try:
-        self._lazy_import_pyautogui()
-        
-        parts = scroll_params.split()
-        direction = parts[0] if parts else 'down'
-        amount = int(parts[1]) if len(parts) > 1 else 3
-        
-        if direction in ['up', 'down']:
-            scroll_amount = amount if direction == 'down' else -amount
-            self.pyautogui.scroll(scroll_amount)
-        elif direction in ['left', 'right']:
-            # Горизонтальная прокрутка (не все системы поддерживают)
-            self.pyautogui.hscroll(amount if direction == 'right' else -amount)
-        
-        print(f"📜 Прокрутка: {direction} {amount}")
-        return ExecutionResult(True, f"Прокрутка {direction}")
-        
-    except Exception as e:
-        return ExecutionResult(False, f"Ошибка прокрутки: {e}")
-
-def _substitute_variables(self, text: str) -> str:
-    """Подстановка переменных в тексте"""
-    # Простая подстановка переменных ${var}
-    # В будущем можно расширить
-    return text
+    
+    def _substitute_variables(self, text: str) -> str:
+        """Подстановка переменных ${var} в тексте (неизвестные остаются как есть)"""
+        # Быстрый путь: нет переменных или подставлять нечего
+        if not self.variables or '${' not in text:
+            return text
+        
+        variables = self.variables
+        return _VARIABLE_RE.sub(
+            lambda match: str(variables.get(match.group(1), match.group(0))),
+            text
+        )
 
 # Пример использования
 if __name__ == "__main__":
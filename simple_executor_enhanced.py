@@ -5,13 +5,65 @@ simple_executor_enhanced.py
 Основан на архитектуре src/core/macro_sequence.py
 """
 
+import os
 import re
+import sys
 import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import MappingProxyType
 from dataclasses import dataclass
 from typing import Optional, Tuple
 
+# Пирамидальный поиск шаблона (coarse-to-fine)
+_PYRAMID_LEVELS = 3             # Сколько раз уменьшаем экран и шаблон в 2 раза
+_PYRAMID_MIN_TEMPLATE_SIDE = 8  # Минимальная сторона шаблона на грубом уровне
+_PYRAMID_ROI_MARGIN = 8         # Запас вокруг найденного места на каждом уровне
+_PYRAMID_COARSE_RATIO = 0.7     # Грубый проход засчитывается от threshold * 0.7
+_PYRAMID_VERIFY_BAND = 0.05     # Чуть ниже этой границы - проверка полным поиском
+
+# Поиск рядом с прошлым совпадением шаблона
+_LAST_MATCH_MARGIN = 200       # Область ±200 логических пикселей вокруг прошлого места
+_LAST_MATCH_MAX_MISSES = 3     # После стольких промахов подряд место забывается
+
+# Паузы между попытками поиска шаблона (адаптивные, по динамике score)
+_RETRY_RISING_DELTA = 0.05  # Рост score больше этого - следующая попытка сразу
+_RETRY_NEAR_SCORE = 0.6     # Score выше этого (но ниже порога) - короткая пауза
+_RETRY_PAUSE_NEAR = 0.2
+_RETRY_PAUSE_IDLE = 0.5
+_FINGERPRINT_SCALE = 1 / 8  # Кадр для проверки "экран не изменился" (блоки 8x8)
+
+# Операции скомпилированного .atlas макроса
+_OP_CALL, _OP_REPEAT, _OP_END = range(3)
+
+_IS_MACOS = sys.platform == 'darwin'
+
+# Маппинг имен приложений
+_APP_MAPPING = MappingProxyType({
+    'ChromeApp': 'Google Chrome',
+    'Chrome': 'Google Chrome',
+    'Calculator': 'Calculator',
+    'Finder': 'Finder',
+    'Safari': 'Safari',
+    'TextEdit': 'TextEdit'
+})
+
+# Папки шаблонов в порядке приоритета (другие папки не просматриваются)
+_TEMPLATE_DIRS = (
+    Path("templates"),
+    Path("templates/Chrome/ChromeBasicGuiButtons"),
+    Path("templates/Chrome/TikTok"),
+    Path("templates/Chrome/YouTube"),
+)
+
+def _template_key(file_name: str) -> str:
+    """Ключ индекса шаблонов: файловая система macOS не различает регистр имен"""
+    return file_name.lower() if _IS_MACOS else file_name
+
+_COORD_RE = re.compile(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)')
+_DURATION_RE = re.compile(r'^([\d.]+)\s*(ms|s)?$')
+
 @dataclass
 class ExecutionResult:
     """Результат выполнения команды"""
@@ -25,23 +77,63 @@ class SimpleExecutorEnhanced:
     Включает продвинутый Computer Vision из macro_sequence.py
     """
     
-    def __init__(self, continue_on_error=False):
-        """Инициализация исполнителя"""
+    def __init__(self, continue_on_error=False, verbose=None):
+        """
+        Инициализация исполнителя
+        
+        Args:
+            continue_on_error: Продолжать выполнение после ошибки команды
+            verbose: Подробный вывод по каждой команде (по умолчанию из MACRO_VERBOSE,
+                     MACRO_VERBOSE=0 оставляет только ошибки и итог)
+        """
         print("⚡ Enhanced SimpleExecutor инициализирован")
         
         # Ленивая загрузка библиотек
         self.pyautogui = None
         self.cv2 = None
         self.numpy = None
+        self.screen_grabber = None  # mss: None - не загружен, False - недоступен
+        self._use_ocl = False       # OpenCL (T-API) для полнокадрового matchTemplate
+        self._capture_pool = None   # Фоновый поток захвата экрана для повторных попыток
+        self._gray_buffers = [None, None]  # Два переиспользуемых кадра в оттенках серого
+        self._gray_buffer_index = 0
+        self._workspace = None      # NSWorkspace: None - не загружен, False - недоступен
+        self._quartz = None         # Quartz: None - не загружен, False - недоступен
         
         # Настройки Computer Vision
         self.default_threshold = 0.8  # Повышенный порог для точности
         self.retry_timeout = 10.0     # Время повторных попыток
         self.display_scale = None     # Масштаб дисплея (Retina)
+        self._screen_size = None      # Логический размер экрана, определяется один раз
+        
+        # Кэш шаблонов: путь -> (mtime, шаблон в оттенках серого)
+        self._template_cache = {}
+        self._template_pyramids = {}  # путь -> [шаблон, pyrDown(шаблон), ...]
+        self._template_index = None   # имя файла -> (приоритет папки, путь), строится один раз
+        self._template_path_cache = {}  # имя шаблона -> найденный путь (промахи не запоминаются)
+        self._last_match = {}           # путь -> [x, y, промахов подряд]
+        self._scroll_cache = {}         # параметры scroll -> (направление, количество, center)
         
         # Настройки обработки ошибок
         self.continue_on_error = continue_on_error  # Продолжать при ошибках
         
+        # Подробный вывод: в тихом режиме print() на горячем пути не вызывается
+        if verbose is None:
+            verbose = os.environ.get('MACRO_VERBOSE', '1') != '0'
+        self.verbose = verbose
+        
+        # Таблица обработчиков команд
+        self._command_handlers = {
+            'open': self._execute_open,
+            'click': self._execute_click,
+            'type': self._execute_type_command,
+            'wait': self._execute_wait,
+            'press': self._execute_press,
+            'hotkey': self._execute_hotkey,
+            'scroll': self._execute_scroll,
+            'repeat': self._execute_repeat,
+        }
+        
         print("⚡ Enhanced SimpleExecutor инициализирован")
     
     def _lazy_import_pyautogui(self):
@@ -52,7 +144,8 @@ class SimpleExecutorEnhanced:
                 self.pyautogui = pyautogui
                 # Настройки безопасности
                 self.pyautogui.FAILSAFE = True
-                self.pyautogui.PAUSE = 0.05
+                # Без паузы после каждого вызова: задержки задаются командами wait
+                self.pyautogui.PAUSE = 0
                 print("📦 PyAutoGUI загружен")
             except ImportError:
                 raise ImportError("PyAutoGUI не установлен. Установите: pip install pyautogui")
@@ -64,6 +157,15 @@ class SimpleExecutorEnhanced:
                 import cv2
                 self.cv2 = cv2
                 print("📦 OpenCV загружен")
+                
+                # Проверяем OpenCL один раз; сборки без T-API работают на CPU
+                try:
+                    self._use_ocl = cv2.ocl.haveOpenCL()
+                    if self._use_ocl:
+                        cv2.ocl.setUseOpenCL(True)
+                        print("📦 OpenCL доступен: matchTemplate на GPU")
+                except AttributeError:
+                    self._use_ocl = False
             except ImportError:
                 raise ImportError("OpenCV не установлен. Установите: pip install opencv-python")
     
@@ -77,15 +179,57 @@ class SimpleExecutorEnhanced:
             except ImportError:
                 raise ImportError("NumPy не установлен. Установите: pip install numpy")
     
+    def _lazy_import_mss(self) -> bool:
+        """Ленивый импорт mss (опционально, иначе скриншоты через PyAutoGUI)"""
+        if self.screen_grabber is None:
+            try:
+                import mss
+                # Один экземпляр на все время работы исполнителя
+                self.screen_grabber = mss.mss()
+                print("📦 mss загружен")
+            except ImportError:
+                self.screen_grabber = False
+        return self.screen_grabber is not False
+    
+    def _lazy_import_appkit(self) -> bool:
+        """Ленивый импорт AppKit (опционально, иначе приложения через /usr/bin/open)"""
+        if self._workspace is None:
+            try:
+                from AppKit import NSWorkspace
+                self._workspace = NSWorkspace.sharedWorkspace()
+            except ImportError:
+                self._workspace = False
+        return self._workspace is not False
+    
+    def _lazy_import_quartz(self) -> bool:
+        """Ленивый импорт Quartz (опционально: захват экрана без mss и screencapture)"""
+        if self._quartz is None:
+            try:
+                import Quartz
+                self._quartz = Quartz
+            except ImportError:
+                self._quartz = False
+        return self._quartz is not False
+    
     def _get_display_scale(self) -> float:
         """Определение масштаба дисплея (Retina)"""
         if self.display_scale is not None:
             return self.display_scale
         
         try:
+            # Масштаб основного экрана через AppKit - без скриншота
+            if self._lazy_import_appkit():
+                from AppKit import NSScreen
+                screens = NSScreen.screens()
+                if screens:
+                    self.display_scale = float(screens[0].backingScaleFactor())
+                    if self.display_scale > 1.0:
+                        print(f"🖥️ Retina Display обнаружен (scale: {self.display_scale}x)")
+                    return self.display_scale
+            
             self._lazy_import_pyautogui()
             
-            screen_size = self.pyautogui.size()
+            screen_size = self._get_screen_size()
             screenshot = self.pyautogui.screenshot()
             
             # Если физическое разрешение больше логического - это Retina
@@ -100,11 +244,18 @@ class SimpleExecutorEnhanced:
             self.display_scale = 1.0
             return 1.0
     
+    def _get_screen_size(self):
+        """Логический размер экрана (pyautogui.size()), один раз за сессию"""
+        if self._screen_size is None:
+            self._lazy_import_pyautogui()
+            self._screen_size = self.pyautogui.size()
+        return self._screen_size
+    
     def execute_atlas_file(self, file_path: str) -> ExecutionResult:
         """
         Выполнение .atlas файла
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         try:
             atlas_path = Path(file_path)
@@ -112,7 +263,7 @@ class SimpleExecutorEnhanced:
                 return ExecutionResult(
                     False, 
                     f"Файл не найден: {file_path}",
-                    time.time() - start_time
+                    time.perf_counter() - start_time
                 )
             
             print(f"🚀 Выполнение макроса: {atlas_path.name}")
@@ -121,14 +272,53 @@ class SimpleExecutorEnhanced:
             commands = self._parse_atlas_file(atlas_path)
             print(f"📋 Найдено команд: {len(commands)}")
             
+            # Разбираем команды один раз, циклы repeat превращаются в переходы
+            ops = self._compile_atlas(commands)
+            loop_stack = []  # [индекс repeat, оставшиеся итерации]
+            
             # Выполняем команды
             failed_commands = []
-            for i, command in enumerate(commands, 1):
-                print(f"🔧 Команда {i}/{len(commands)}: {command}")
+            executed_count = 0
+            position = 0
+            while position < len(ops):
+                opcode, payload = ops[position]
+                command = commands[position]
+                executed_count += 1
+                if self.verbose:
+                    print(f"🔧 Команда {position + 1}/{len(commands)}: {command}")
+                
+                if opcode == _OP_REPEAT:
+                    count, end_position = payload
+                    if self.verbose:
+                        print(f"🔄 Начинаю цикл repeat на {count} итераций")
+                    if count == 0:
+                        # Пустой цикл - сразу за его end
+                        position = end_position + 1
+                        continue
+                    loop_stack.append([position, count])
+                    position += 1
+                    continue
+                
+                if opcode == _OP_END:
+                    loop = loop_stack[-1]
+                    loop[1] -= 1
+                    if loop[1] > 0:
+                        # Следующая итерация: переход к первой команде тела
+                        position = loop[0] + 1
+                        continue
+                    loop_stack.pop()
+                    position += 1
+                    continue
+                
+                handler, args = payload
+                try:
+                    result = handler(args)
+                except Exception as e:
+                    result = ExecutionResult(False, f"Ошибка выполнения команды '{command}': {e}")
+                position += 1
                 
-                result = self._execute_command(command)
                 if not result.success:
-                    failed_commands.append(f"Команда {i}: {result.message}")
+                    failed_commands.append(f"Команда {position}: {result.message}")
                     
                     if self.continue_on_error:
                         print(f"⚠️ Ошибка (продолжаем): {result.message}")
@@ -136,20 +326,20 @@ class SimpleExecutorEnhanced:
                     else:
                         return ExecutionResult(
                             False,
-                            f"Ошибка на команде {i}: {result.message}",
-                            time.time() - start_time
+                            f"Ошибка на команде {position}: {result.message}",
+                            time.perf_counter() - start_time
                         )
             
-            execution_time = time.time() - start_time
+            execution_time = time.perf_counter() - start_time
             
             # Формируем итоговое сообщение
             if failed_commands:
-                success_count = len(commands) - len(failed_commands)
-                print(f"⚠️ Выполнено: {success_count}/{len(commands)} команд (с ошибками)")
+                success_count = executed_count - len(failed_commands)
+                print(f"⚠️ Выполнено: {success_count}/{executed_count} команд (с ошибками)")
                 print(f"❌ Неудачные команды: {len(failed_commands)}")
                 for error in failed_commands:
                     print(f"   • {error}")
-                message = f"Макрос выполнен с ошибками ({success_count}/{len(commands)} команд)"
+                message = f"Макрос выполнен с ошибками ({success_count}/{executed_count} команд)"
             else:
                 print(f"✅ Выполнено: Макрос выполнен успешно ({len(commands)} команд)")
                 message = f"Макрос выполнен успешно ({len(commands)} команд)"
@@ -166,24 +356,70 @@ class SimpleExecutorEnhanced:
             return ExecutionResult(
                 False,
                 f"Критическая ошибка: {e}",
-                time.time() - start_time
+                time.perf_counter() - start_time
             )
     
     def _parse_atlas_file(self, file_path: Path) -> list:
         """Парсинг .atlas файла"""
-        commands = []
+        text = file_path.read_text(encoding='utf-8')
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                
-                # Пропускаем комментарии и пустые строки
-                if not line or line.startswith('#'):
+        # Одна strip() на строку; пустые строки и комментарии пропускаются
+        return [
+            line for raw_line in text.splitlines()
+            if (line := raw_line.strip()) and line[0] != '#'
+        ]
+    
+    def _compile_atlas(self, commands: list) -> list:
+        """
+        Компиляция команд в операции (по одной на команду, тот же порядок)
+        
+        Операции:
+            (_OP_CALL, (обработчик, аргумент)) - вызов обработчика команды
+            (_OP_REPEAT, (количество, индекс end)) - начало цикла "repeat N:"
+            (_OP_END, индекс repeat) - конец цикла, переход назад
+        """
+        ops = []
+        open_loops = []
+        
+        for command in commands:
+            action, _, args = command.partition(' ')
+            action = action.lower()
+            
+            if action == 'end' and open_loops:
+                start = open_loops.pop()
+                ops[start] = (_OP_REPEAT, (ops[start][1], len(ops)))
+                ops.append((_OP_END, start))
+                continue
+            
+            if action == 'repeat':
+                count = args.rstrip(':').strip()
+                if count.isdigit():
+                    # Индекс end подставляется, когда цикл закроется
+                    open_loops.append(len(ops))
+                    ops.append((_OP_REPEAT, int(count)))
                     continue
-                
-                commands.append(line)
+            
+            ops.append((_OP_CALL, self._resolve_command(command)))
+        
+        # repeat без end - как раньше, тело выполняется один раз
+        for start in open_loops:
+            ops[start] = (_OP_CALL, self._resolve_command(commands[start]))
         
-        return commands
+        return ops
+    
+    def _resolve_command(self, command: str) -> tuple:
+        """Обработчик команды и его аргумент"""
+        action, _, args = command.partition(' ')
+        action = action.lower()
+        
+        handler = self._command_handlers.get(action)
+        if handler is None:
+            return self._unknown_command, action
+        return handler, args
+    
+    def _unknown_command(self, action: str) -> ExecutionResult:
+        """Неизвестная команда (в том числе end вне цикла)"""
+        return ExecutionResult(False, f"Неизвестная команда: {action}")
     
     def _execute_command(self, command: str) -> ExecutionResult:
         """Выполнение одной команды"""
@@ -193,53 +429,29 @@ class SimpleExecutorEnhanced:
             if not command:
                 return ExecutionResult(True, "Пустая команда")
             
-            # Парсим команду
-            parts = command.split(' ', 1)
-            action = parts[0].lower()
-            args = parts[1] if len(parts) > 1 else ""
-            
-            # Маршрутизация команд
-            if action == 'open':
-                return self._execute_open(args)
-            elif action == 'click':
-                return self._execute_click(args)
-            elif action == 'type':
-                return self._execute_type(args.strip('"'))
-            elif action == 'wait':
-                return self._execute_wait(args)
-            elif action == 'press':
-                return self._execute_press(args)
-            elif action == 'hotkey':
-                return self._execute_hotkey(args)
-            elif action == 'scroll':
-                return self._execute_scroll(args)
-            elif action == 'repeat':
-                return self._execute_repeat(args)
-            else:
-                return ExecutionResult(False, f"Неизвестная команда: {action}")
+            handler, args = self._resolve_command(command)
+            return handler(args)
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка выполнения команды '{command}': {e}")
     
+    def _execute_type_command(self, args: str) -> ExecutionResult:
+        """Команда type: текст в кавычках"""
+        return self._execute_type(args.strip('"'))
+    
     def _execute_open(self, app_name: str) -> ExecutionResult:
         """Открытие приложения"""
         try:
-            # Маппинг имен приложений
-            app_mapping = {
-                'ChromeApp': 'Google Chrome',
-                'Chrome': 'Google Chrome',
-                'Calculator': 'Calculator',
-                'Finder': 'Finder',
-                'Safari': 'Safari',
-                'TextEdit': 'TextEdit'
-            }
-            
-            actual_app_name = app_mapping.get(app_name, app_name)
-            
-            # Используем системную команду open на macOS
-            subprocess.run(['open', '-a', actual_app_name], check=True)
-            
-            print(f"✅ Приложение открыто: {actual_app_name}")
+            actual_app_name = _APP_MAPPING.get(app_name, app_name)
+            
+            # Запрос напрямую в Launch Services, без процесса /usr/bin/open
+            launched = self._lazy_import_appkit() and self._workspace.launchApplication_(actual_app_name)
+            if not launched:
+                # Используем системную команду open на macOS
+                subprocess.run(['open', '-a', actual_app_name], check=True)
+            
+            if self.verbose:
+                print(f"✅ Приложение открыто: {actual_app_name}")
             return ExecutionResult(True, f"Приложение {actual_app_name} открыто")
         
         except subprocess.CalledProcessError as e:
@@ -251,7 +463,7 @@ class SimpleExecutorEnhanced:
         """Выполнение клика"""
         try:
             # Проверяем координаты: click (x, y)
-            coord_match = re.match(r'\(\s*(\d+)\s*,\s*(\d+)\s*\)', target)
+            coord_match = _COORD_RE.match(target)
             if coord_match:
                 x, y = map(int, coord_match.groups())
                 return self._click_coordinates(x, y)
@@ -268,7 +480,8 @@ class SimpleExecutorEnhanced:
             self._lazy_import_pyautogui()
             
             self.pyautogui.click(x, y)
-            print(f"🖱️ Клик по координатам ({x}, {y})")
+            if self.verbose:
+                print(f"🖱️ Клик по координатам ({x}, {y})")
             return ExecutionResult(True, f"Клик по координатам ({x}, {y})")
         
         except Exception as e:
@@ -291,8 +504,9 @@ class SimpleExecutorEnhanced:
                 x, y = coords
                 self._lazy_import_pyautogui()
                 self.pyautogui.click(x, y)
-                print(f"✅ Шаблон найден с уверенностью {score:.3f}")
-                print(f"🖱️ Клик по шаблону {template_name} в ({x}, {y})")
+                if self.verbose:
+                    print(f"✅ Шаблон найден с уверенностью {score:.3f}")
+                    print(f"🖱️ Клик по шаблону {template_name} в ({x}, {y})")
                 return ExecutionResult(True, f"Клик по шаблону {template_name}")
             else:
                 print(f"⚠️ Низкая уверенность поиска: {score:.3f}")
@@ -304,114 +518,399 @@ class SimpleExecutorEnhanced:
     
     def _find_template_file(self, template_name: str) -> Optional[Path]:
         """Поиск файла шаблона"""
+        if template_name in self._template_path_cache:
+            return self._template_path_cache[template_name]
+        
         # Возможные имена файлов
-        possible_names = [
+        possible_names = (
             f"{template_name}.png",
             f"{template_name}-btn.png",
             f"{template_name}_btn.png"
-        ]
+        )
         
-        # Возможные папки
-        possible_dirs = [
-            Path("templates"),
-            Path("templates/Chrome/ChromeBasicGuiButtons"),
-            Path("templates/Chrome/TikTok"),
-            Path("templates/Chrome/YouTube")
-        ]
+        # Ищем файл в индексе вместо проверки .exists() по каждой папке
+        index_was_built = self._template_index is not None
+        template_path = self._lookup_template_index(possible_names)
+        
+        if template_path is None and index_was_built:
+            # Шаблон могли добавить после построения индекса: один повторный обход.
+            # Найденные ранее пути сбрасываются: новый файл в более приоритетной
+            # папке должен победить, как при прежнем поиске
+            self._template_index = None
+            self._template_path_cache.clear()
+            template_path = self._lookup_template_index(possible_names)
         
-        # Ищем файл
-        for directory in possible_dirs:
-            if directory.exists():
-                for name in possible_names:
-                    template_path = directory / name
-                    if template_path.exists():
-                        return template_path
+        # Промах не запоминается: следующий поиск снова обойдет папки,
+        # и снятый после ошибки шаблон найдется без перезапуска
+        if template_path is not None:
+            self._template_path_cache[template_name] = template_path
+        return template_path
+    
+    def _lookup_template_index(self, possible_names: Tuple[str, ...]) -> Optional[Path]:
+        """
+        Путь шаблона по индексу в порядке прежнего поиска
         
-        return None
+        Папки перебираются по приоритету _TEMPLATE_DIRS, внутри папки - варианты имени
+        по порядку: побеждает вариант из самой приоритетной папки
+        """
+        index = self._get_template_index()
+        candidates = [index[key] for key in map(_template_key, possible_names) if key in index]
+        if not candidates:
+            return None
+        # min стабилен: при равном приоритете папки остается первый вариант имени
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+    
+    def _get_template_index(self) -> dict:
+        """Индекс шаблонов: имя файла -> (приоритет папки, путь), один обход папок"""
+        if self._template_index is None:
+            index = {}
+            
+            # При совпадении имен запоминается самая приоритетная папка
+            for rank, directory in enumerate(_TEMPLATE_DIRS):
+                if directory.is_dir():
+                    for path in directory.glob("*.png"):
+                        index.setdefault(_template_key(path.name), (rank, path))
+            
+            self._template_index = index
+        return self._template_index
     
     def _find_template_with_retry(self, template_path: Path) -> Tuple[bool, Optional[Tuple[int, int]], float]:
         """Улучшенный поиск шаблона с повторными попытками и обработкой ошибок"""
-        print(f"🔍 Поиск шаблона (макс. {self.retry_timeout}с, threshold: {self.default_threshold})...")
-        start_time = time.time()
+        if self.verbose:
+            print(f"🔍 Поиск шаблона (макс. {self.retry_timeout}с, threshold: {self.default_threshold})...")
+        # Монотонные часы: срок не сдвигается при переводе системного времени
+        deadline = time.monotonic() + self.retry_timeout
+        
+        try:
+            self._lazy_import_opencv()
+            self._lazy_import_numpy()
+            self._lazy_import_pyautogui()
+            
+            # Шаблон один раз на весь поиск, а не на каждую попытку
+            template = self._get_template_gray(template_path)
+        except (ImportError, OSError) as e:
+            print(f"❌ {e}")
+            return False, None, 0.0
+        
+        if template is None:
+            print(f"❌ Не удалось загрузить шаблон: {template_path}")
+            return False, None, 0.0
         
         last_score = 0.0
         attempt = 0
+        next_report = time.monotonic() + 2.0
+        
+        # Конвейер: без паузы следующий кадр снимается в фоне, пока сопоставляется текущий
+        capture_pool = self._get_capture_pool()
+        next_frame = None
+        pause = 0.0
+        last_fingerprint = None
         
-        while time.time() - start_time < self.retry_timeout:
+        while time.monotonic() < deadline:
             attempt += 1
             try:
-                found, coords, score = self._find_template_advanced(template_path)
-                last_score = score
+                frame = next_frame or capture_pool.submit(self._grab_screen_gray)
+                next_frame = capture_pool.submit(self._grab_screen_gray) if not pause else None
+                
+                gray = frame.result()
                 
-                if found:
-                    return True, coords, score
+                # Экран не изменился с прошлой неудачной попытки - сопоставление дало бы то же
+                fingerprint = self._frame_fingerprint(gray)
+                if last_fingerprint is not None and self.numpy.array_equal(fingerprint, last_fingerprint):
+                    score = last_score
+                else:
+                    found, coords, score = self._find_template_advanced(template_path, gray, template)
+                    if found:
+                        return True, coords, score
+                last_fingerprint = fingerprint
+                
+                pause = self._retry_pause(score, last_score)
+                last_score = score
                 
                 # Если не найден, проверяем возможные причины
-                if attempt % 4 == 0:  # Каждые 2 секунды
+                if self.verbose and time.monotonic() >= next_report:  # Каждые 2 секунды
+                    next_report += 2.0
                     print(f"🔄 Попытка {attempt}, лучший score: {last_score:.3f}")
                     if last_score < 0.3:
                         print("⚠️ Возможно, объект не виден (переключен рабочий стол?)")
                 
             except Exception as e:
                 print(f"⚠️ Ошибка поиска на попытке {attempt}: {e}")
-                # Продолжаем попытки даже при ошибках
+                # Продолжаем попытки даже при ошибках, но не чаще раза в 0.5с
+                pause = _RETRY_PAUSE_IDLE
+                last_fingerprint = None
             
-            time.sleep(0.5)  # Пауза между попытками
+            if pause:
+                # Кадр, снятый до паузы, устарел бы - следующий снимаем после нее
+                next_frame = None
+                time.sleep(min(pause, max(0.0, deadline - time.monotonic())))
         
         print(f"❌ Шаблон не найден за {self.retry_timeout}с, финальный score: {last_score:.3f}")
         return False, None, last_score
     
-    def _find_template_advanced(self, template_path: Path) -> Tuple[bool, Optional[Tuple[int, int]], float]:
-        """Продвинутый поиск шаблона с обработкой Retina дисплеев"""
+    def _frame_fingerprint(self, gray):
+        """
+        Уменьшенная в 8 раз копия кадра для сравнения с предыдущим
+        
+        Усреднение по блокам 8x8: появление кнопки меняет значения блоков,
+        в отличие от 64-битного хэша всего экрана
+        """
+        return self.cv2.resize(
+            gray, None, fx=_FINGERPRINT_SCALE, fy=_FINGERPRINT_SCALE,
+            interpolation=self.cv2.INTER_AREA
+        )
+    
+    def _retry_pause(self, score: float, previous_score: float) -> float:
+        """
+        Пауза перед следующей попыткой по динамике score
+        
+        Счет растет (экран меняется, страница грузится) - опрашиваем без паузы,
+        близко к порогу - коротко, экран ничем не похож на шаблон - реже
+        """
+        if score - previous_score > _RETRY_RISING_DELTA:
+            return 0.0
+        if score >= _RETRY_NEAR_SCORE:
+            return _RETRY_PAUSE_NEAR
+        return _RETRY_PAUSE_IDLE
+    
+    def _get_template_gray(self, template_path: Path):
+        """
+        Шаблон в оттенках серого, загружается один раз (None - не удалось прочитать)
+        
+        Шаблон приводится к логическим пикселям экрана (на Retina уменьшается
+        в display_scale раз), как и скриншот в _find_template_advanced
+        """
+        mtime = template_path.stat().st_mtime
+        cached = self._template_cache.get(template_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        template = self.cv2.imread(str(template_path), self.cv2.IMREAD_GRAYSCALE)
+        if template is None:
+            return None
+        
+        display_scale = self._get_display_scale()
+        if display_scale > 1.0:
+            template = self.cv2.resize(
+                template, None, fx=1 / display_scale, fy=1 / display_scale,
+                interpolation=self.cv2.INTER_AREA
+            )
+        
+        self._template_cache[template_path] = (mtime, template)
+        self._template_pyramids.pop(template_path, None)
+        return template
+    
+    def _get_capture_pool(self) -> ThreadPoolExecutor:
+        """Один рабочий поток захвата экрана (mss используется только из него)"""
+        if self._capture_pool is None:
+            self._capture_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="atlas-capture")
+        return self._capture_pool
+    
+    def _grab_screen_gray(self):
+        """Скриншот основного экрана в оттенках серого (физическое разрешение)"""
+        if self._lazy_import_mss():
+            # mss читает кадр напрямую, без временного файла screencapture
+            raw = self.screen_grabber.grab(self.screen_grabber.monitors[1])
+            frame = self.numpy.frombuffer(raw.bgra, dtype=self.numpy.uint8).reshape(raw.height, raw.width, 4)
+            gray_buffer = self._next_gray_buffer(raw.height, raw.width)
+            return self.cv2.cvtColor(frame, self.cv2.COLOR_BGRA2GRAY, dst=gray_buffer)
+        
+        if self._lazy_import_quartz():
+            # Кадр основного дисплея сразу в память, без процесса screencapture и PNG
+            quartz = self._quartz
+            image = quartz.CGDisplayCreateImage(quartz.CGMainDisplayID())
+            # None - нет разрешения на запись экрана; разбираем только 8-битный BGRA,
+            # другие форматы (например, 64 бита на пиксель) снимает PyAutoGUI
+            if (image is not None and quartz.CGImageGetBitsPerPixel(image) == 32
+                    and quartz.CGImageGetBitsPerComponent(image) == 8):
+                width = quartz.CGImageGetWidth(image)
+                height = quartz.CGImageGetHeight(image)
+                bytes_per_row = quartz.CGImageGetBytesPerRow(image)
+                data = quartz.CGDataProviderCopyData(quartz.CGImageGetDataProvider(image))
+                
+                # Строки могут быть выровнены: лишние пиксели справа отрезаем
+                frame = self.numpy.frombuffer(data, dtype=self.numpy.uint8).reshape(
+                    height, bytes_per_row // 4, 4
+                )[:, :width]
+                gray_buffer = self._next_gray_buffer(height, width)
+                return self.cv2.cvtColor(frame, self.cv2.COLOR_BGRA2GRAY, dst=gray_buffer)
+        
+        screenshot = self.pyautogui.screenshot()
+        
+        # Сразу в оттенки серого (без промежуточного BGR кадра)
+        frame = self.numpy.asarray(screenshot)
+        gray_buffer = self._next_gray_buffer(frame.shape[0], frame.shape[1])
+        return self.cv2.cvtColor(frame, self.cv2.COLOR_RGB2GRAY, dst=gray_buffer)
+    
+    def _next_gray_buffer(self, height: int, width: int):
+        """
+        Буфер для следующего кадра вместо нового массива на каждый скриншот
+        
+        Буферов два: пока один кадр сопоставляется, в другой снимается следующий
+        (в _find_template_with_retry одновременно ожидается не больше одного кадра)
+        """
+        self._gray_buffer_index ^= 1
+        gray_buffer = self._gray_buffers[self._gray_buffer_index]
+        if gray_buffer is None or gray_buffer.shape != (height, width):
+            # Первый кадр или изменилось разрешение экрана
+            gray_buffer = self.numpy.empty((height, width), dtype=self.numpy.uint8)
+            self._gray_buffers[self._gray_buffer_index] = gray_buffer
+        return gray_buffer
+    
+    def _find_template_advanced(self, template_path: Path, gray=None,
+                                template=None) -> Tuple[bool, Optional[Tuple[int, int]], float]:
+        """
+        Продвинутый поиск шаблона с обработкой Retina дисплеев
+        
+        gray - уже снятый кадр в оттенках серого; без него экран снимается здесь
+        template - уже загруженный шаблон (из _get_template_gray); без него загружается здесь
+        """
         try:
             self._lazy_import_opencv()
             self._lazy_import_numpy()
             self._lazy_import_pyautogui()
             
-            # Загружаем шаблон
-            template = self.cv2.imread(str(template_path), self.cv2.IMREAD_GRAYSCALE)
+            # Загружаем шаблон (из кэша, если файл не менялся)
             if template is None:
-                return False, None, 0.0
+                template = self._get_template_gray(template_path)
+                if template is None:
+                    return False, None, 0.0
+            h, w = template.shape[:2]
             
             # Захват экрана
-            screenshot = self.pyautogui.screenshot()
+            if gray is None:
+                gray = self._grab_screen_gray()
+            
+            # Сопоставляем в логических пикселях: на Retina в 4 раза меньше работы
+            # matchTemplate и буфер результата, координаты сразу для pyautogui.click()
+            display_scale = self._get_display_scale()
+            if display_scale > 1.0:
+                gray = self.cv2.resize(
+                    gray, None, fx=1 / display_scale, fy=1 / display_scale,
+                    interpolation=self.cv2.INTER_AREA
+                )
             
-            # Конвертируем в OpenCV формат
-            frame = self.numpy.array(screenshot)
-            frame = self.cv2.cvtColor(frame, self.cv2.COLOR_RGB2BGR)
-            gray = self.cv2.cvtColor(frame, self.cv2.COLOR_BGR2GRAY)
+            # Сначала ищем рядом с прошлым совпадением: кнопка обычно на том же месте
+            max_val, max_loc = 0.0, None
+            last_match = self._last_match.get(template_path)
+            if last_match is not None:
+                screen_h, screen_w = gray.shape[:2]
+                x0 = max(0, last_match[0] - _LAST_MATCH_MARGIN)
+                y0 = max(0, last_match[1] - _LAST_MATCH_MARGIN)
+                x1 = min(screen_w, last_match[0] + w + _LAST_MATCH_MARGIN)
+                y1 = min(screen_h, last_match[1] + h + _LAST_MATCH_MARGIN)
+                if x1 - x0 >= w and y1 - y0 >= h:
+                    max_val, roi_loc = self._find_template_pyramid(gray[y0:y1, x0:x1], template, template_path)
+                    max_loc = (roi_loc[0] + x0, roi_loc[1] + y0)
             
-            # Template matching
-            res = self.cv2.matchTemplate(gray, template, self.cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = self.cv2.minMaxLoc(res)
+            if max_val < self.default_threshold:
+                # Template matching: от грубого уровня пирамиды к полному разрешению
+                max_val, max_loc = self._find_template_pyramid(gray, template, template_path)
             
             if max_val >= self.default_threshold:
-                h, w = template.shape
+                self._last_match[template_path] = [max_loc[0], max_loc[1], 0]
                 
-                # Вычисляем центр в физическом разрешении
+                # Центр шаблона (логическое разрешение)
                 center_x = max_loc[0] + w // 2
                 center_y = max_loc[1] + h // 2
                 
-                # Корректируем координаты для pyautogui.click() (логическое разрешение)
-                display_scale = self._get_display_scale()
-                center_x = int(center_x / display_scale)
-                center_y = int(center_y / display_scale)
-                
                 return True, (center_x, center_y), max_val
             
+            if last_match is not None:
+                last_match[2] += 1
+                if last_match[2] >= _LAST_MATCH_MAX_MISSES:
+                    del self._last_match[template_path]
+            
             return False, None, max_val
         
         except Exception as e:
             print(f"❌ Ошибка продвинутого поиска: {e}")
             return False, None, 0.0
     
+    def _find_template_pyramid(self, gray, template, template_path: Path,
+                               levels: int = _PYRAMID_LEVELS) -> Tuple[float, Tuple[int, int]]:
+        """
+        Coarse-to-fine поиск: полный matchTemplate только на самом грубом уровне,
+        на более точных уровнях - в небольшой области вокруг найденного места
+        
+        Returns:
+            (уверенность, левый верхний угол совпадения в полном разрешении)
+        """
+        # Не уменьшаем шаблон до неразличимого размера
+        while levels > 0 and (min(template.shape[:2]) >> levels) < _PYRAMID_MIN_TEMPLATE_SIDE:
+            levels -= 1
+        
+        if levels > 0:
+            templates = self._template_pyramids.get(template_path)
+            if templates is None or len(templates) <= levels:
+                templates = [template]
+                for _ in range(levels):
+                    templates.append(self.cv2.pyrDown(templates[-1]))
+                self._template_pyramids[template_path] = templates
+            
+            screens = [gray]
+            for _ in range(levels):
+                screens.append(self.cv2.pyrDown(screens[-1]))
+            
+            max_val, max_loc = self._match_full_frame(screens[levels], templates[levels])
+            coarse_gate = self.default_threshold * _PYRAMID_COARSE_RATIO
+            
+            if max_val < coarse_gate - _PYRAMID_VERIFY_BAND:
+                # Явный промах: без полного поиска, оценка с грубого уровня
+                return max_val, (max_loc[0] << levels, max_loc[1] << levels)
+            
+            if max_val >= coarse_gate:
+                for level in range(levels - 1, -1, -1):
+                    screen, level_template = screens[level], templates[level]
+                    screen_h, screen_w = screen.shape[:2]
+                    template_h, template_w = level_template.shape[:2]
+                    
+                    x, y = max_loc[0] * 2, max_loc[1] * 2
+                    x0 = max(0, x - _PYRAMID_ROI_MARGIN)
+                    y0 = max(0, y - _PYRAMID_ROI_MARGIN)
+                    x1 = min(screen_w, x + template_w + _PYRAMID_ROI_MARGIN)
+                    y1 = min(screen_h, y + template_h + _PYRAMID_ROI_MARGIN)
+                    if x1 - x0 < template_w or y1 - y0 < template_h:
+                        break
+                    
+                    res = self.cv2.matchTemplate(screen[y0:y1, x0:x1], level_template, self.cv2.TM_CCOEFF_NORMED)
+                    _, max_val, _, max_loc = self.cv2.minMaxLoc(res)
+                    max_loc = (max_loc[0] + x0, max_loc[1] + y0)
+                else:
+                    # Уточнение дошло до полного разрешения: и совпадение, и промах окончательны
+                    return max_val, max_loc
+        
+        # Полный поиск: маленький шаблон, грубая оценка у самой границы
+        # или область уточнения вышла за край кадра
+        return self._match_full_frame(gray, template)
+    
+    def _match_full_frame(self, screen, template) -> Tuple[float, Tuple[int, int]]:
+        """matchTemplate по всему кадру (через UMat на GPU, если есть OpenCL)"""
+        if self._use_ocl:
+            # minMaxLoc принимает UMat, результат не копируем обратно целиком
+            screen = self.cv2.UMat(screen)
+            template = self.cv2.UMat(template)
+        
+        res = self.cv2.matchTemplate(screen, template, self.cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = self.cv2.minMaxLoc(res)
+        return max_val, max_loc
+    
     def _execute_type(self, text: str) -> ExecutionResult:
         """Ввод текста"""
         try:
-            self._lazy_import_pyautogui()
+            if _IS_MACOS:
+                # Вся строка одним keystroke через System Events вместо события на символ
+                escaped = text.replace('\\', '\\\\').replace('"', '\\"')
+                subprocess.run(
+                    ['osascript', '-e', f'tell application "System Events" to keystroke "{escaped}"'],
+                    check=True
+                )
+            else:
+                self._lazy_import_pyautogui()
+                self.pyautogui.typewrite(text)
             
-            self.pyautogui.typewrite(text)
-            print(f"⌨️ Введен текст: {text}")
+            if self.verbose:
+                print(f"⌨️ Введен текст: {text}")
             return ExecutionResult(True, f"Введен текст: {text}")
         
         except Exception as e:
@@ -420,15 +919,17 @@ class SimpleExecutorEnhanced:
     def _execute_wait(self, duration: str) -> ExecutionResult:
         """Ожидание"""
         try:
-            # Парсим длительность
-            if duration.endswith('s'):
-                seconds = float(duration[:-1])
-            elif duration.endswith('ms'):
-                seconds = float(duration[:-2]) / 1000
-            else:
-                seconds = float(duration)
+            # Парсим длительность: 3s, 1.5s, 500ms или просто секунды
+            duration_match = _DURATION_RE.match(duration.strip())
+            if not duration_match:
+                return ExecutionResult(False, f"Неверный формат времени: {duration}")
+            
+            seconds = float(duration_match.group(1))
+            if duration_match.group(2) == 'ms':
+                seconds /= 1000
             
-            print(f"⏳ Ожидание {seconds}с...")
+            if self.verbose:
+                print(f"⏳ Ожидание {seconds}с...")
             time.sleep(seconds)
             return ExecutionResult(True, f"Ожидание {seconds}с")
         
@@ -441,7 +942,8 @@ class SimpleExecutorEnhanced:
             self._lazy_import_pyautogui()
             
             self.pyautogui.press(key)
-            print(f"⌨️ Нажата клавиша: {key}")
+            if self.verbose:
+                print(f"⌨️ Нажата клавиша: {key}")
             return ExecutionResult(True, f"Нажата клавиша: {key}")
         
         except Exception as e:
@@ -454,7 +956,8 @@ class SimpleExecutorEnhanced:
             
             keys = hotkey.split('+')
             self.pyautogui.hotkey(*keys)
-            print(f"⌨️ Горячие клавиши: {hotkey}")
+            if self.verbose:
+                print(f"⌨️ Горячие клавиши: {hotkey}")
             return ExecutionResult(True, f"Горячие клавиши: {hotkey}")
         
         except Exception as e:
@@ -465,25 +968,28 @@ class SimpleExecutorEnhanced:
         try:
             self._lazy_import_pyautogui()
             
-            parts = scroll_params.split()
-            direction = parts[0] if parts else 'down'
-            
-            # Проверяем есть ли указание center
-            use_center = 'center' in parts
-            amount = 10  # Увеличиваем по умолчанию для лучшей видимости
-            
-            # Ищем числовое значение в параметрах
-            for part in parts:
-                if part.isdigit():
-                    amount = int(part)
-                    break
+            # Параметры разбираются один раз (циклы повторяют одни и те же команды)
+            parsed = self._scroll_cache.get(scroll_params)
+            if parsed is None:
+                parts = scroll_params.split()
+                direction = parts[0] if parts else 'down'
+                
+                # Проверяем есть ли указание center
+                use_center = 'center' in parts
+                
+                # Первое числовое значение в параметрах (по умолчанию 10 для лучшей видимости)
+                amount = next((int(part) for part in parts if part.isdigit()), 10)
+                
+                parsed = self._scroll_cache[scroll_params] = (direction, amount, use_center)
+            direction, amount, use_center = parsed
             
             # Если указан center, перемещаем курсор в центр экрана
             if use_center:
-                screen_width, screen_height = self.pyautogui.size()
+                screen_width, screen_height = self._get_screen_size()
                 center_x, center_y = screen_width // 2, screen_height // 2
                 self.pyautogui.moveTo(center_x, center_y)
-                print(f"🎯 Курсор перемещен в центр экрана ({center_x}, {center_y})")
+                if self.verbose:
+                    print(f"🎯 Курсор перемещен в центр экрана ({center_x}, {center_y})")
             
             if direction in ['up', 'down']:
                 scroll_amount = amount if direction == 'down' else -amount
@@ -494,27 +1000,24 @@ class SimpleExecutorEnhanced:
                     # Метод 1: PyAutoGUI scroll (увеличенная сила)
                     enhanced_amount = scroll_amount * 3  # Утраиваем силу
                     self.pyautogui.scroll(enhanced_amount)
-                    print(f"📜 Использован PyAutoGUI scroll (сила x3: {enhanced_amount})")
+                    if self.verbose:
+                        print(f"📜 Использован PyAutoGUI scroll (сила x3: {enhanced_amount})")
                     success = True
                 except Exception as e1:
                     try:
                         # Метод 2: Клавиши Page Up/Down (более эффективно)
-                        import subprocess
                         key_code = 121 if direction == 'down' else 116  # Page Down : Page Up
-                        for _ in range(max(1, abs(scroll_amount) // 3)):
-                            subprocess.run(['osascript', '-e', f'tell application "System Events" to key code {key_code}'], check=True)
-                            time.sleep(0.1)
-                        print(f"📜 Использованы клавиши Page {direction.title()}")
+                        self._repeat_key_code(key_code, max(1, abs(scroll_amount) // 3), 0.1)
+                        if self.verbose:
+                            print(f"📜 Использованы клавиши Page {direction.title()}")
                         success = True
                     except Exception as e2:
                         try:
                             # Метод 3: Клавиши стрелок (много нажатий)
-                            import subprocess
                             key_code = 125 if direction == 'down' else 126  # Down : Up
-                            for _ in range(abs(scroll_amount)):
-                                subprocess.run(['osascript', '-e', f'tell application "System Events" to key code {key_code}'], check=True)
-                                time.sleep(0.05)
-                            print(f"📜 Использованы клавиши стрелок ({abs(scroll_amount)} нажатий)")
+                            self._repeat_key_code(key_code, abs(scroll_amount), 0.05)
+                            if self.verbose:
+                                print(f"📜 Использованы клавиши стрелок ({abs(scroll_amount)} нажатий)")
                             success = True
                         except Exception as e3:
                             try:
@@ -523,7 +1026,8 @@ class SimpleExecutorEnhanced:
                                     for _ in range(max(1, abs(scroll_amount) // 5)):
                                         self.pyautogui.press('space')
                                         time.sleep(0.2)
-                                    print(f"📜 Использован пробел для скролла")
+                                    if self.verbose:
+                                        print(f"📜 Использован пробел для скролла")
                                     success = True
                                 else:
                                     raise Exception("Пробел только для скролла вниз")
@@ -545,14 +1049,32 @@ class SimpleExecutorEnhanced:
                     print(f"⚠️ Горизонтальная прокрутка не поддерживается: {e}")
             
             location_text = " в центре экрана" if use_center else ""
-            print(f"📜 Прокрутка: {direction} {amount}{location_text}")
+            if self.verbose:
+                print(f"📜 Прокрутка: {direction} {amount}{location_text}")
             return ExecutionResult(True, f"Прокрутка {direction}{location_text}")
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка прокрутки: {e}")
     
+    def _repeat_key_code(self, key_code: int, count: int, delay: float):
+        """Нажатие клавиши count раз одним запуском osascript (цикл внутри AppleScript)"""
+        script = (
+            'tell application "System Events"\n'
+            f'    repeat {count} times\n'
+            f'        key code {key_code}\n'
+            f'        delay {delay}\n'
+            '    end repeat\n'
+            'end tell'
+        )
+        subprocess.run(['osascript', '-e', script], check=True)
+    
     def _execute_repeat(self, repeat_params: str) -> ExecutionResult:
-        """Выполнение цикла repeat"""
+        """
+        Команда repeat без парного end
+        
+        Циклы с end выполняет execute_atlas_file (см. _compile_atlas), сюда попадает
+        только незакрытый repeat: команды после него выполняются один раз
+        """
         try:
             # Парсим параметры: "5:" или "5"
             count_str = repeat_params.rstrip(':').strip()
@@ -560,11 +1082,10 @@ class SimpleExecutorEnhanced:
                 return ExecutionResult(False, f"Некорректное количество повторений: {repeat_params}")
             
             count = int(count_str)
-            print(f"🔄 Начинаю цикл repeat на {count} итераций")
+            if self.verbose:
+                print(f"⚠️ repeat {count} без end: команды ниже выполнятся один раз")
             
-            # Для простоты пока возвращаем успех
-            # В полной реализации нужно парсить блок команд с отступами
-            return ExecutionResult(True, f"Цикл repeat {count} раз (базовая реализация)")
+            return ExecutionResult(True, f"repeat {count} без end: команды выполнены один раз")
         
         except Exception as e:
             return ExecutionResult(False, f"Ошибка цикла repeat: {e}")
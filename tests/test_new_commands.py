@@ -3,7 +3,11 @@
 Тест новых команд: repeat и scroll down center
 """
 
-from simple_executor_enhanced import SimpleExecutorEnhanced
+import os
+import tempfile
+
+from simple_executor import SimpleExecutor
+from simple_executor_enhanced import SimpleExecutorEnhanced, ExecutionResult
 
 def test_scroll_center():
     """Тест команды scroll down center"""
@@ -27,6 +31,80 @@ def test_repeat():
     print(f"📝 Сообщение: {result.message}")
     return result.success
 
+def _record_press(executor):
+    """Подменяет обработчик press: вместо нажатия запоминает аргумент"""
+    calls = []
+    
+    def press(args):
+        calls.append(args)
+        return ExecutionResult(True, f"press {args}")
+    
+    executor._command_handlers['press'] = press
+    return calls
+
+def test_repeat_loops():
+    """Тест выполнения циклов repeat ... end через execute_atlas_file"""
+    print("🧪 Тестируем циклы 'repeat N: ... end'")
+    
+    macro = """press start
+repeat 2:
+    press a
+    repeat 3:
+        press b
+    end
+end
+repeat 0:
+    press never
+end
+repeat 2:
+press unclosed
+"""
+    
+    executor = SimpleExecutorEnhanced(verbose=False)
+    calls = _record_press(executor)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        macro_file = os.path.join(tmp, "loops.atlas")
+        with open(macro_file, "w", encoding="utf-8") as f:
+            f.write(macro)
+        result = executor.execute_atlas_file(macro_file)
+    
+    print(f"✅ Результат: {result.success}")
+    print(f"📝 Вызовы: {calls}")
+    assert result.success
+    # Вложенный цикл, repeat 0 пропускается, незакрытый repeat - тело один раз
+    assert calls == ["start"] + (["a"] + ["b"] * 3) * 2 + ["unclosed"]
+    return True
+
+def test_repeat_loops_simple_executor():
+    """Тест циклов repeat ... end через SimpleExecutor.execute_atlas_content"""
+    print("🧪 Тестируем циклы в SimpleExecutor")
+    
+    macro = """press start
+repeat 2:
+    press a
+    repeat 3:
+        press b
+    end
+end
+repeat 0:
+    press never
+end
+repeat 2:
+press unclosed
+"""
+    
+    executor = SimpleExecutor(verbose=False)
+    calls = _record_press(executor)
+    result = executor.execute_atlas_content(macro)
+    
+    print(f"✅ Результат: {result.success}")
+    print(f"📝 Вызовы: {calls}")
+    assert result.success
+    # Вложенный цикл, repeat 0 пропускается, незакрытый repeat - тело один раз
+    assert calls == ["start"] + (["a"] + ["b"] * 3) * 2 + ["unclosed"]
+    return True
+
 def main():
     print("🚀 Тестирование новых команд")
     print("=" * 50)
@@ -39,12 +117,22 @@ def main():
     success2 = test_repeat()
     print()
     
+    # Тест 3: циклы repeat ... end
+    success3 = test_repeat_loops()
+    print()
+    
+    # Тест 4: циклы в SimpleExecutor
+    success4 = test_repeat_loops_simple_executor()
+    print()
+    
     # Итоги
     print("📊 Результаты тестов:")
     print(f"   scroll down center: {'✅' if success1 else '❌'}")
     print(f"   repeat 5:          {'✅' if success2 else '❌'}")
+    print(f"   repeat ... end:    {'✅' if success3 else '❌'}")
+    print(f"   SimpleExecutor:    {'✅' if success4 else '❌'}")
     
-    if success1 and success2:
+    if success1 and success2 and success3 and success4:
         print("🎉 Все тесты прошли успешно!")
     else:
         print("⚠️ Некоторые тесты не прошли")
@@ -62,10 +62,9 @@ def test_scroll_methods_manual():
     print("\n5️⃣ Тест клавиш стрелок:")
     try:
         import subprocess
-        # Нажимаем стрелку вниз 3 раза
-        for i in range(3):
-            subprocess.run(['osascript', '-e', 'tell application "System Events" to key code 125'], check=True)
-            time.sleep(0.5)
+        # Нажимаем стрелку вниз 3 раза одним вызовом osascript
+        script = 'tell application "System Events"\nrepeat 3 times\nkey code 125\ndelay 0.5\nend repeat\nend tell'
+        subprocess.run(['osascript', '-e', script], check=True)
         print("✅ Клавиши стрелок работают")
     except Exception as e:
         print(f"❌ Ошибка клавиш: {e}")
@@ -141,7 +140,7 @@ def test_scroll_in_browser():
             ("Колесо мыши (среднее)", lambda: pyautogui.scroll(10)),
             ("Колесо мыши (малое)", lambda: pyautogui.scroll(5)),
             ("Пробел (Page Down)", lambda: pyautogui.press('space')),
-            ("Стрелка вниз x5", lambda: [pyautogui.press('down') for _ in range(5)]),
+            ("Стрелка вниз x5", lambda: pyautogui.press('down', presses=5)),
         ]
         
         for name, method in browser_methods:
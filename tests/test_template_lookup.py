@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Тест выбора файла шаблона при совпадении имен в разных папках
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+from simple_executor_enhanced import SimpleExecutorEnhanced
+
+def _find_in_tree(files, template_names):
+    """Создает временную папку templates с пустыми файлами и ищет в ней шаблоны"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for name in files:
+                Path(name).parent.mkdir(parents=True, exist_ok=True)
+                Path(name).touch()
+            
+            executor = SimpleExecutorEnhanced(verbose=False)
+            return [executor._find_template_file(name) for name in template_names]
+        finally:
+            os.chdir(cwd)
+
+def test_directory_priority():
+    """Вариант имени из приоритетной папки важнее точного имени из следующей"""
+    print("🧪 Тестируем приоритет папок шаблонов")
+    
+    found, = _find_in_tree(["templates/X-btn.png", "templates/Chrome/TikTok/X.png"], ["X"])
+    print(f"   X -> {found}")
+    assert found == Path("templates/X-btn.png")
+    
+    found, = _find_in_tree([
+        "templates/Chrome/YouTube/Y.png",
+        "templates/Chrome/ChromeBasicGuiButtons/Y.png",
+    ], ["Y"])
+    print(f"   Y -> {found}")
+    assert found == Path("templates/Chrome/ChromeBasicGuiButtons/Y.png")
+    return True
+
+def test_name_order_within_directory():
+    """Внутри одной папки точное имя важнее вариантов -btn и _btn"""
+    print("\n🧪 Тестируем порядок вариантов имени")
+    
+    found, = _find_in_tree(["templates/Z_btn.png", "templates/Z-btn.png", "templates/Z.png"], ["Z"])
+    print(f"   Z -> {found}")
+    assert found == Path("templates/Z.png")
+    return True
+
+def test_other_directories_ignored():
+    """Шаблоны вне основных папок не находятся"""
+    print("\n🧪 Тестируем папки вне списка")
+    
+    found, = _find_in_tree(["templates/Other/W.png"], ["W"])
+    print(f"   W -> {found}")
+    assert found is None
+    return True
+
+def test_rescan_keeps_priority():
+    """Повторный обход после промаха сохраняет приоритет папок"""
+    print("\n🧪 Тестируем повторный обход индекса")
+    
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            Path("templates/Chrome/TikTok").mkdir(parents=True)
+            Path("templates/Chrome/TikTok/M.png").touch()
+            executor = SimpleExecutorEnhanced(verbose=False)
+            assert executor._find_template_file("M") == Path("templates/Chrome/TikTok/M.png")
+            assert executor._find_template_file("L") is None
+            
+            # Шаблоны добавлены после построения индекса (L - после промаха)
+            Path("templates/Chrome/TikTok/N.png").touch()
+            Path("templates/N-btn.png").touch()
+            Path("templates/M-btn.png").touch()
+            Path("templates/L.png").touch()
+            found_l = executor._find_template_file("L")
+            found_n = executor._find_template_file("N")
+            found_m = executor._find_template_file("M")
+        finally:
+            os.chdir(cwd)
+    
+    print(f"   N -> {found_n}")
+    print(f"   M -> {found_m}")
+    print(f"   L -> {found_l}")
+    assert found_n == Path("templates/N-btn.png")
+    assert found_m == Path("templates/M-btn.png")
+    assert found_l == Path("templates/L.png")
+    return True
+
+def main():
+    print("🚀 Тестирование поиска файлов шаблонов")
+    print("=" * 50)
+    
+    results = [
+        test_directory_priority(),
+        test_name_order_within_directory(),
+        test_other_directories_ignored(),
+        test_rescan_keeps_priority(),
+    ]
+    
+    if all(results):
+        print("\n🎉 Все тесты прошли успешно!")
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,26 @@ import os
 import sys
 from pathlib import Path
 from datetime import datetime
+from typing import Tuple
 import re
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Нет на Windows
+
+_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+_TIMESTAMP_RE = re.compile(r'_\d{8}_\d{6}$')
+_NAME_SEPARATORS = str.maketrans('_-', '  ')
+_VAR_RE = re.compile(r'\$\{([^}]+)\}')
+
 class VariableCreator:
     """Создатель DSL переменных"""
     
     def __init__(self):
         self.variables_file = Path("data/dsl_variables.txt")
         self.variables_file.parent.mkdir(parents=True, exist_ok=True)
+        self._names_cache = None  # (mtime_ns, имена переменных)
         
     def create_variable_interactive(self):
         """Интерактивное создание переменной"""
@@ -60,8 +72,15 @@ class VariableCreator:
         
         print(f"✅ Переменная ${{{var_name}}} создана успешно!")
         
-    def create_variable_from_file(self, atlas_file: str, var_name: str = None, description: str = None):
-        """Создание переменной из .atlas файла"""
+    def create_variable_from_file(self, atlas_file: str, var_name: str = None, description: str = None,
+                                  refresh: bool = True):
+        """
+        Создание переменной из .atlas файла
+        
+        Args:
+            refresh: Обновить DSL справочник сразу (False - для пакетного импорта,
+                     справочник обновляется потом командой refresh)
+        """
         atlas_path = Path(atlas_file)
         
         if not atlas_path.exists():
@@ -76,22 +95,21 @@ class VariableCreator:
             print(f"❌ Ошибка чтения файла: {e}")
             return False
         
-        # Извлекаем описание из файла если не задано
+        # Извлекаем описание и очищаем код от комментариев метаданных
+        parsed_description, atlas_code = self._parse_atlas(content)
         if not description:
-            description = self._extract_description_from_atlas(content)
+            description = parsed_description
         
         # Генерируем имя переменной если не задано
         if not var_name:
             var_name = self._generate_variable_name_from_file(atlas_path)
         
-        # Очищаем код от комментариев метаданных
-        atlas_code = self._clean_atlas_code(content)
-        
         # Сохраняем переменную
         self._save_variable(var_name, description, atlas_code)
         
         # Обновляем DSL справочник
-        self._update_dsl_reference()
+        if refresh:
+            self._update_dsl_reference()
         
         print(f"✅ Переменная ${{{var_name}}} создана из файла {atlas_file}")
         return True
@@ -101,58 +119,53 @@ class VariableCreator:
         if not name:
             return False
         # Только буквы, цифры и подчеркивания
-        return re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', name) is not None
-    
-    def _extract_description_from_atlas(self, content: str) -> str:
-        """Извлечение описания из .atlas файла"""
-        lines = content.split('\n')
-        for line in lines:
-            if line.startswith("# Description:"):
-                return line.replace("# Description:", "").strip()
-        
-        # Если нет описания, ищем первый комментарий
-        for line in lines:
-            line = line.strip()
-            if line.startswith("#") and not line.startswith("# Generated") and not line.startswith("# Created"):
-                return line[1:].strip()
-        
-        return "Пользовательская переменная"
+        return _NAME_RE.match(name) is not None
     
     def _generate_variable_name_from_file(self, file_path: Path) -> str:
         """Генерация имени переменной из имени файла"""
         name = file_path.stem
         # Убираем временные метки
-        name = re.sub(r'_\d{8}_\d{6}$', '', name)
+        name = _TIMESTAMP_RE.sub('', name)
         # Заменяем разделители на CamelCase
-        parts = re.split(r'[_\-\s]+', name)
-        return ''.join(word.capitalize() for word in parts if word)
+        parts = name.translate(_NAME_SEPARATORS).split()
+        return ''.join(word.capitalize() for word in parts)
     
-    def _clean_atlas_code(self, content: str) -> str:
-        """Очистка .atlas кода от метаданных"""
-        lines = content.split('\n')
+    def _parse_atlas(self, content: str) -> Tuple[str, str]:
+        """
+        Разбор .atlas файла за один проход
+        
+        Returns:
+            (описание, код без метаданных)
+        """
+        description = None
+        first_comment = None
         cleaned_lines = []
         
-        for line in lines:
-            line_stripped = line.strip()
+        for line in content.split('\n'):
+            line_stripped = line.lstrip()
+            
+            # Описание из метаданных, иначе - первый комментарий
+            if description is None and line.startswith("# Description:"):
+                description = line.replace("# Description:", "").strip()
+            if (first_comment is None and line_stripped.startswith("#") and
+                    not line_stripped.startswith(("# Generated", "# Created"))):
+                first_comment = line_stripped[1:].strip()
+            
             # Пропускаем метаданные
-            if (line_stripped.startswith("# Generated") or 
-                line_stripped.startswith("# Created") or
-                line_stripped.startswith("# Description:")):
+            if line_stripped.startswith(("# Generated", "# Created", "# Description:")):
+                continue
+            # Убираем пустые строки в начале
+            if not cleaned_lines and not line_stripped:
                 continue
             cleaned_lines.append(line)
         
-        # Убираем пустые строки в начале
-        while cleaned_lines and not cleaned_lines[0].strip():
-            cleaned_lines.pop(0)
+        if description is None:
+            description = first_comment if first_comment is not None else "Пользовательская переменная"
         
-        return '\n'.join(cleaned_lines)
+        return description, '\n'.join(cleaned_lines)
     
     def _save_variable(self, var_name: str, description: str, atlas_code: str):
         """Сохранение переменной в файл"""
-        # Проверяем существует ли файл
-        if not self.variables_file.exists():
-            self._create_variables_file_header()
-        
         # Добавляем переменную
         variable_entry = f"""
 ${{{var_name}}}
@@ -170,11 +183,11 @@ ${{{var_name}}}
 """
         
         # Добавляем в файл
-        with open(self.variables_file, 'a', encoding='utf-8') as f:
+        with self._open_variables_file() as f:
             f.write(variable_entry)
     
-    def _create_variables_file_header(self):
-        """Создание заголовка файла переменных"""
+    def _open_variables_file(self):
+        """Открытие файла переменных на дозапись (новый файл получает заголовок)"""
         header = """================================================================================
 ПОЛЬЗОВАТЕЛЬСКИЕ DSL ПЕРЕМЕННЫЕ
 ================================================================================
@@ -184,25 +197,63 @@ ${{{var_name}}}
 
 ================================================================================
 """
-        with open(self.variables_file, 'w', encoding='utf-8') as f:
-            f.write(header)
+        fh = open(self.variables_file, 'a', encoding='utf-8')
+        
+        # Под блокировкой, чтобы два процесса не записали заголовок дважды
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            if fh.seek(0, os.SEEK_END) == 0:
+                fh.write(header)
+                fh.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        
+        return fh
     
     def _update_dsl_reference(self):
         """Обновление DSL справочника"""
         try:
-            import subprocess
-            result = subprocess.run([
-                "python3", "dsl_reference_generator.py", 
-                "--output", "data/DSL_REFERENCE.txt"
-            ], capture_output=True, text=True, cwd=Path.cwd())
+            try:
+                from utils.dsl_reference_generator import DSLReferenceGenerator
+            except ImportError:
+                try:
+                    # Запуск как скрипта из папки utils
+                    from dsl_reference_generator import DSLReferenceGenerator
+                except ImportError:
+                    DSLReferenceGenerator = None
+            
+            if DSLReferenceGenerator is not None:
+                # Генерируем справочник в текущем процессе
+                output_path = DSLReferenceGenerator().generate_reference("data/DSL_REFERENCE.txt")
+                updated = output_path is not None
+                error = "нет шаблонов для генерации справочника"
+            else:
+                # Запускаем генератор отдельным процессом
+                import subprocess
+                result = subprocess.run([
+                    "python3", str(Path(__file__).with_name("dsl_reference_generator.py")),
+                    "--output", "data/DSL_REFERENCE.txt"
+                ], capture_output=True, text=True, cwd=Path.cwd())
+                updated = result.returncode == 0
+                error = result.stderr
             
-            if result.returncode == 0:
+            if updated:
                 print("🔄 DSL справочник обновлен")
             else:
-                print(f"⚠️ Ошибка обновления справочника: {result.stderr}")
+                print(f"⚠️ Ошибка обновления справочника: {error}")
         except Exception as e:
             print(f"⚠️ Не удалось обновить справочник: {e}")
     
+    def _get_variable_names(self) -> list:
+        """Имена переменных из файла (перечитывается только после изменения файла)"""
+        mtime = self.variables_file.stat().st_mtime_ns
+        if self._names_cache is None or self._names_cache[0] != mtime:
+            content = self.variables_file.read_text(encoding='utf-8')
+            self._names_cache = (mtime, _VAR_RE.findall(content))
+        return self._names_cache[1]
+    
     def list_variables(self):
         """Список всех переменных"""
         if not self.variables_file.exists():
@@ -210,11 +261,7 @@ ${{{var_name}}}
             return
         
         try:
-            with open(self.variables_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Ищем переменные
-            variables = re.findall(r'\$\{([^}]+)\}', content)
+            variables = self._get_variable_names()
             
             print("📋 Доступные DSL переменные:")
             print("=" * 40)
@@ -229,24 +276,31 @@ def main():
     """Главная функция"""
     creator = VariableCreator()
     
-    if len(sys.argv) > 1:
-        command = sys.argv[1]
+    # --no-refresh: не обновлять справочник после каждого файла
+    args = [arg for arg in sys.argv[1:] if arg != "--no-refresh"]
+    refresh = len(args) == len(sys.argv) - 1
+    
+    if args:
+        command = args[0]
         
         if command == "create":
             creator.create_variable_interactive()
-        elif command == "from-file" and len(sys.argv) > 2:
-            atlas_file = sys.argv[2]
-            var_name = sys.argv[3] if len(sys.argv) > 3 else None
-            description = sys.argv[4] if len(sys.argv) > 4 else None
-            creator.create_variable_from_file(atlas_file, var_name, description)
+        elif command == "from-file" and len(args) > 1:
+            atlas_file = args[1]
+            var_name = args[2] if len(args) > 2 else None
+            description = args[3] if len(args) > 3 else None
+            creator.create_variable_from_file(atlas_file, var_name, description, refresh=refresh)
         elif command == "list":
             creator.list_variables()
+        elif command == "refresh":
+            creator._update_dsl_reference()
         else:
             print("❌ Неверная команда")
             print("Использование:")
             print("  python3 variable_creator.py create")
-            print("  python3 variable_creator.py from-file <file.atlas> [name] [description]")
+            print("  python3 variable_creator.py from-file <file.atlas> [name] [description] [--no-refresh]")
             print("  python3 variable_creator.py list")
+            print("  python3 variable_creator.py refresh")
     else:
         creator.create_variable_interactive()
 